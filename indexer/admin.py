@@ -0,0 +1,7 @@
+from django.contrib import admin
+from indexer.models import IndexWatermark
+
+
+@admin.register(IndexWatermark)
+class IndexWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("collection", "modified", "updated")
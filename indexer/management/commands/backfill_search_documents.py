@@ -0,0 +1,113 @@
+from time import perf_counter
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min, Q
+
+# Model name: (related fields used by get_search_document(), fields loaded for get_search_document()).
+BACKFILL_MODELS = {
+    "referral": (("type", "referring_org"), None),
+    "task": (("type",), None),
+    "record": ((), ("name", "infobase_id", "uploaded_file_content", "description")),
+    "note": ((), ("note",)),
+    "condition": ((), ("condition", "proposed_condition", "identifier")),
+}
+
+
+class Command(BaseCommand):
+    help = "Populates the search_document (and search_vector) fields in batches, without calling save()"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="store",
+            required=False,
+            type=str,
+            dest="model",
+            choices=BACKFILL_MODELS.keys(),
+            help="Name of the model to backfill (default: all models)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            required=False,
+            type=int,
+            default=1000,
+            dest="batch_size",
+            help="Size of each PK range to update in a single transaction (default: 1000)",
+        )
+        parser.add_argument(
+            "--start-pk",
+            action="store",
+            required=False,
+            type=int,
+            default=None,
+            dest="start_pk",
+            help="Resume from this PK (as reported by a previous, interrupted run)",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="all",
+            default=False,
+            help="Recompute every row, rather than only rows having a NULL search_document or search_vector",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("Batch size must be a positive integer")
+
+        if options["model"]:
+            models = [options["model"]]
+        else:
+            models = list(BACKFILL_MODELS.keys())
+            if options["start_pk"] is not None:
+                raise CommandError("The --start-pk option requires --model")
+
+        for model in models:
+            self.backfill_model(model, batch_size, options["start_pk"], options["all"])
+
+        self.stdout.write("Completed")
+
+    def backfill_model(self, model_name, batch_size, start_pk=None, all_rows=False):
+        """Update the search_document field of a model by PK range, using one bulk UPDATE per range.
+        No model save() methods, signals, revisions or index tasks are triggered; the search_vector
+        field is kept in sync by its database trigger.
+        """
+        model = apps.get_model("referral", model_name)
+        related, fields = BACKFILL_MODELS[model_name]
+        qs = model.objects.all()
+        if not all_rows:
+            # Updating search_document also fills an empty search_vector, via the database trigger.
+            qs = qs.filter(Q(search_document__isnull=True) | Q(search_vector__isnull=True))
+        bounds = qs.aggregate(min_pk=Min("pk"), max_pk=Max("pk"))
+        if bounds["min_pk"] is None:
+            self.stdout.write(f"{model_name}: nothing to backfill")
+            return
+
+        lo = max(bounds["min_pk"], start_pk or 0)
+        total = 0
+        start = perf_counter()
+        self.stdout.write(f"{model_name}: backfilling PKs {lo} to {bounds['max_pk']}")
+
+        while lo <= bounds["max_pk"]:
+            hi = lo + batch_size
+            batch = qs.filter(pk__gte=lo, pk__lt=hi).select_related(*related)
+            if fields:
+                batch = batch.only("pk", *fields)
+            objs = list(batch)
+            for obj in objs:
+                obj.search_document = obj.get_search_document()
+            with transaction.atomic():
+                model.objects.bulk_update(objs, ["search_document"])
+            total += len(objs)
+
+            elapsed = perf_counter() - start
+            rate = total / elapsed if elapsed else 0
+            progress = (hi - bounds["min_pk"]) / (bounds["max_pk"] - bounds["min_pk"] + 1) * 100
+            self.stdout.write(f"{model_name}: {total} updated, next PK {hi} ({min(progress, 100):.0f}%, {rate:.0f} rows/sec)")
+            lo = hi
+
+        self.stdout.write(f"{model_name}: backfilled {total} rows in {perf_counter() - start:.1f}s")
@@ -0,0 +1,104 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from indexer.utils import (
+    COLLECTION_MODELS,
+    get_collection_queryset,
+    get_indexed_ids,
+    get_record_chunk_documents,
+    get_typesense_client,
+    typesense_delete_documents,
+    typesense_import_documents,
+)
+
+# Collections having one document per database object (i.e. document ID == object PK).
+# Record chunk documents are reconciled along with their record.
+RECONCILE_COLLECTIONS = [collection for collection in COLLECTION_MODELS.keys() if collection != "record_chunks"]
+
+
+class Command(BaseCommand):
+    help = "Compares database objects against Typesense documents, indexing missing objects and deleting stale documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection",
+            action="store",
+            required=False,
+            type=str,
+            dest="collection",
+            choices=RECONCILE_COLLECTIONS,
+            help="Name of the collection to reconcile (default: all collections)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            required=False,
+            type=int,
+            default=500,
+            dest="batch_size",
+            help="Number of documents to upsert or delete in each Typesense request (default: 500)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Report drift counts only, without changing the index",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("Batch size must be a positive integer")
+
+        if options["collection"]:
+            collections = [options["collection"]]
+        else:
+            collections = RECONCILE_COLLECTIONS
+
+        client = get_typesense_client()
+
+        for collection in collections:
+            self.reconcile_collection(collection, client, batch_size, options["dry_run"])
+
+        self.stdout.write("Completed")
+
+    def reconcile_collection(self, collection, client, batch_size, dry_run=False):
+        """Diff the set of current object PKs against the set of indexed document IDs for a collection."""
+        start = perf_counter()
+        db_ids = {str(pk) for pk in get_collection_queryset(collection).values_list("pk", flat=True).iterator(chunk_size=10000)}
+        indexed_ids = get_indexed_ids(collection, client)
+        missing = sorted(db_ids - indexed_ids, key=int)
+        stale = sorted(indexed_ids - db_ids, key=int)
+        self.stdout.write(
+            f"{collection}: {len(db_ids)} objects, {len(indexed_ids)} documents, {len(missing)} missing, {len(stale)} stale "
+            f"(compared in {perf_counter() - start:.1f}s)"
+        )
+        if dry_run:
+            return
+
+        get_document = COLLECTION_MODELS[collection][1]
+        failed_ids = []
+        failed_chunk_ids = []
+        for i in range(0, len(missing), batch_size):
+            objects = list(get_collection_queryset(collection).filter(pk__in=missing[i : i + batch_size]))
+            failed_ids += typesense_import_documents(collection, [get_document(obj) for obj in objects], client)
+            if collection == "records" and settings.TYPESENSE_RECORD_CHUNKS:
+                # Replace any existing chunks of the missing records.
+                typesense_delete_documents("record_chunks", missing[i : i + batch_size], client, field="record_id")
+                chunks = [chunk for obj in objects for chunk in get_record_chunk_documents(obj)]
+                for j in range(0, len(chunks), batch_size):
+                    failed_chunk_ids += typesense_import_documents("record_chunks", chunks[j : j + batch_size], client)
+
+        deleted = 0
+        for i in range(0, len(stale), batch_size):
+            deleted += typesense_delete_documents(collection, stale[i : i + batch_size], client)
+            if collection == "records" and settings.TYPESENSE_RECORD_CHUNKS:
+                typesense_delete_documents("record_chunks", stale[i : i + batch_size], client, field="record_id")
+
+        self.stdout.write(f"{collection}: indexed {len(missing) - len(failed_ids)} missing documents, deleted {deleted} stale documents")
+        if failed_ids:
+            self.stdout.write(f"{collection}: failed ids {', '.join(failed_ids)}")
+        if failed_chunk_ids:
+            self.stdout.write(f"record_chunks: failed ids {', '.join(failed_chunk_ids)}")
@@ -0,0 +1,226 @@
+from datetime import timedelta
+from time import perf_counter
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from indexer.models import IndexWatermark
+from indexer.utils import (
+    COLLECTION_MODELS,
+    create_versioned_collection,
+    get_collection_queryset,
+    get_typesense_client,
+    swap_collection_alias,
+    typesense_delete_documents,
+    typesense_import_documents,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds one or all Typesense collections using batched bulk imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--collection",
+            action="store",
+            required=False,
+            type=str,
+            dest="collection",
+            choices=COLLECTION_MODELS.keys(),
+            help="Name of the collection to rebuild (default: all collections)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            required=False,
+            type=int,
+            default=200,
+            dest="batch_size",
+            help="Number of documents to send to Typesense in each import request (default: 200)",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            dest="rebuild",
+            default=False,
+            help="Index into a new versioned collection, then swap the collection alias to it (no search downtime)",
+        )
+        parser.add_argument(
+            "--keep-old",
+            action="store_true",
+            dest="keep_old",
+            default=False,
+            help="When rebuilding, retain the previous versioned collection instead of dropping it",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help="Index only objects modified since the collection's recorded high-water mark",
+        )
+        parser.add_argument(
+            "--overlap",
+            action="store",
+            required=False,
+            type=int,
+            default=60,
+            dest="overlap",
+            help="Incremental mode: seconds to re-index prior to the high-water mark, to allow for in-flight transactions (default: 60)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("Batch size must be a positive integer")
+        if options["rebuild"] and options["incremental"]:
+            raise CommandError("The --rebuild and --incremental options cannot be used together")
+
+        if options["collection"]:
+            collections = [options["collection"]]
+        else:
+            collections = list(COLLECTION_MODELS.keys())
+
+        client = get_typesense_client()
+
+        for collection in collections:
+            if options["rebuild"]:
+                self.rebuild_collection(collection, client, batch_size, options["keep_old"])
+            elif options["incremental"]:
+                self.sync_collection(collection, client, batch_size, options["overlap"])
+            else:
+                start = timezone.now()
+                if not self.reindex_collection(collection, client, batch_size):
+                    self.set_watermark(collection, start)
+
+        self.stdout.write("Completed")
+
+    def rebuild_collection(self, collection, client, batch_size, keep_old=False):
+        """Fill a new versioned collection while searches continue to use the existing one,
+        then swap the alias so that searches use the new collection. If any documents fail to import
+        into the new collection, the alias is not swapped and the new collection is dropped; the
+        high-water mark is only advanced if every document was imported successfully.
+        """
+        start = timezone.now()
+        new_collection = create_versioned_collection(collection, client)
+        self.stdout.write(f"Created collection {new_collection}")
+        if self.reindex_collection(collection, client, batch_size, target=new_collection):
+            client.collections[new_collection].delete()
+            self.stdout.write(f"{collection}: alias not swapped due to failed documents, dropped collection {new_collection}")
+            return
+
+        old_collection = swap_collection_alias(collection, new_collection, client)
+        self.stdout.write(f"Alias {collection} now points to {new_collection}")
+
+        # Objects saved during the rebuild were indexed into the previous collection, so push them again.
+        queryset = get_collection_queryset(collection).filter(modified__gte=start)
+        if self.reindex_collection(collection, client, batch_size, queryset=queryset):
+            # Retain the previous collection and the high-water mark, so that the failed documents are
+            # retried by the next incremental sync.
+            self.stdout.write(f"{collection}: high-water mark not advanced due to failed documents")
+            if old_collection:
+                self.stdout.write(f"{collection}: retained collection {old_collection}")
+            return
+
+        if old_collection and not keep_old:
+            client.collections[old_collection].delete()
+            self.stdout.write(f"Dropped collection {old_collection}")
+
+        self.set_watermark(collection, start)
+
+    def sync_collection(self, collection, client, batch_size, overlap):
+        """Index only those objects modified since the collection high-water mark was recorded, and remove
+        objects deleted since then. The mark is only advanced if every document was imported successfully,
+        so that failed documents are retried on the next run.
+        """
+        start = timezone.now()
+        queryset = get_collection_queryset(collection)
+        watermark = IndexWatermark.objects.filter(collection=collection).first()
+        if watermark:
+            since = watermark.modified - timedelta(seconds=overlap)
+            queryset = queryset.filter(modified__gte=since)
+            self.stdout.write(f"{collection}: indexing objects modified since {watermark.modified.isoformat()}")
+            self.unindex_deleted(collection, client, batch_size, since)
+        else:
+            self.stdout.write(f"{collection}: no high-water mark recorded, indexing all objects")
+
+        failed_ids = self.reindex_collection(collection, client, batch_size, queryset=queryset)
+        if failed_ids:
+            self.stdout.write(f"{collection}: high-water mark not advanced due to failed documents")
+        else:
+            self.set_watermark(collection, start)
+
+    def unindex_deleted(self, collection, client, batch_size, since):
+        """Remove the documents of objects deleted since `since` from the collection, using one filtered
+        delete request per batch. For deleted referrals, the documents of child objects are also removed.
+        """
+        model = COLLECTION_MODELS[collection][0]
+        field = "record_id" if collection == "record_chunks" else "id"
+        pks = list(apps.get_model("referral", model).objects.deleted().filter(modified__gte=since).values_list("pk", flat=True))
+
+        total_deleted = 0
+        for i in range(0, len(pks), batch_size):
+            ids = [str(pk) for pk in pks[i : i + batch_size]]
+            total_deleted += typesense_delete_documents(collection, ids, client, field=field)
+            if model == "referral":
+                for child_collection, (child_model, _) in COLLECTION_MODELS.items():
+                    if child_model != "referral":
+                        total_deleted += typesense_delete_documents(child_collection, ids, client, field="referral_id")
+        self.stdout.write(f"{collection}: removed {total_deleted} documents of {len(pks)} deleted objects")
+
+    def set_watermark(self, collection, modified):
+        """Record the high-water mark for a collection."""
+        IndexWatermark.objects.update_or_create(collection=collection, defaults={"modified": modified})
+
+    def reindex_collection(self, collection, client, batch_size, target=None, queryset=None):
+        """Stream the collection queryset from the database and bulk import documents in batches.
+        Documents are imported into `target` if supplied, otherwise into the named collection (or alias).
+        """
+        get_document = COLLECTION_MODELS[collection][1]
+        if queryset is None:
+            queryset = get_collection_queryset(collection)
+        collection = target or collection
+        self.stdout.write(f"Indexing {queryset.count()} objects into {collection}")
+
+        total_docs = 0
+        total_failed = []
+        batch_no = 0
+        documents = []
+        start = batch_start = perf_counter()
+
+        for obj in queryset.iterator(chunk_size=batch_size):
+            document = get_document(obj)
+            # Some collections (e.g. record_chunks) have several documents for each object.
+            documents.extend(document if isinstance(document, list) else [document])
+            if len(documents) >= batch_size:
+                batch_no += 1
+                total_failed += self.import_batch(collection, documents, client, batch_no, batch_start)
+                total_docs += len(documents)
+                documents = []
+                batch_start = perf_counter()
+
+        if documents:
+            batch_no += 1
+            total_failed += self.import_batch(collection, documents, client, batch_no, batch_start)
+            total_docs += len(documents)
+
+        elapsed = perf_counter() - start
+        rate = total_docs / elapsed if elapsed else 0
+        self.stdout.write(f"{collection}: indexed {total_docs} documents in {elapsed:.1f}s ({rate:.1f} docs/sec), {len(total_failed)} failed")
+        if total_failed:
+            self.stdout.write(f"{collection}: failed ids {', '.join(total_failed)}")
+
+        return total_failed
+
+    def import_batch(self, collection, documents, client, batch_no, start):
+        """Import a single batch of documents, report its throughput and return any failed ids.
+        Throughput includes the time taken to build the batch documents.
+        """
+        failed_ids = typesense_import_documents(collection, documents, client)
+        elapsed = perf_counter() - start
+        rate = len(documents) / elapsed if elapsed else 0
+        msg = f"{collection} batch {batch_no}: {len(documents)} documents in {elapsed:.2f}s ({rate:.1f} docs/sec)"
+        if failed_ids:
+            msg += f", failed ids: {', '.join(failed_ids)}"
+        self.stdout.write(msg)
+        return failed_ids
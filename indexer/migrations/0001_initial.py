@@ -0,0 +1,23 @@
+# Generated by Django 5.2.17 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=64, unique=True)),
+                ('modified', models.DateTimeField(help_text='Objects modified after this timestamp have not yet been indexed.')),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
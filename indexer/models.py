@@ -0,0 +1,14 @@
+from django.db import models
+
+
+class IndexWatermark(models.Model):
+    """A model to record the high-water mark of object modified timestamps which have been
+    pushed to a Typesense collection (used for incremental indexing).
+    """
+
+    collection = models.CharField(max_length=64, unique=True)
+    modified = models.DateTimeField(help_text="Objects modified after this timestamp have not yet been indexed.")
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.collection} ({self.modified.isoformat()})"
@@ -1,4 +1,8 @@
 # Typesense document schemas.
+# Each schema name is used as an alias, pointing to a versioned collection (e.g. referrals_v7).
+# Create or rebuild collections with: python manage.py reindex_collections --rebuild
+# Child object schemas include denormalised fields of the parent referral (referral_*), which are
+# updated whenever the referral is indexed.
 REFERRALS_SCHEMA = {
     "name": "referrals",
     "fields": [
@@ -26,16 +30,45 @@ RECORDS_SCHEMA = {
         {"name": "file_name", "type": "string", "optional": True},
         {"name": "file_type", "type": "string", "facet": True, "optional": True},
         {"name": "file_content", "type": "string", "optional": True},
+        {"name": "referral_reference", "type": "string", "optional": True, "index": False},
+        {"name": "referral_type", "type": "string", "facet": True, "optional": True},
+        {"name": "referral_regions", "type": "string[]", "facet": True, "optional": True},
+        {"name": "referral_address", "type": "string", "optional": True, "index": False},
     ],
 }
 # client.collections.create(RECORDS_SCHEMA)
 
+# Record file content split into page-sized chunks (used if TYPESENSE_RECORD_CHUNKS is enabled).
+# Search results are grouped by record_id to return one hit per record.
+RECORD_CHUNKS_SCHEMA = {
+    "name": "record_chunks",
+    "fields": [
+        {"name": "created", "type": "float"},
+        {"name": "record_id", "type": "int32", "facet": True},
+        {"name": "referral_id", "type": "int32"},
+        {"name": "name", "type": "string"},
+        {"name": "description", "type": "string", "optional": True},
+        {"name": "file_name", "type": "string", "optional": True},
+        {"name": "page", "type": "int32"},
+        {"name": "file_content", "type": "string", "optional": True},
+        {"name": "referral_reference", "type": "string", "optional": True, "index": False},
+        {"name": "referral_type", "type": "string", "facet": True, "optional": True},
+        {"name": "referral_regions", "type": "string[]", "facet": True, "optional": True},
+        {"name": "referral_address", "type": "string", "optional": True, "index": False},
+    ],
+}
+# client.collections.create(RECORD_CHUNKS_SCHEMA)
+
 NOTES_SCHEMA = {
     "name": "notes",
     "fields": [
         {"name": "created", "type": "float"},
         {"name": "referral_id", "type": "int32"},
         {"name": "note", "type": "string"},
+        {"name": "referral_reference", "type": "string", "optional": True, "index": False},
+        {"name": "referral_type", "type": "string", "facet": True, "optional": True},
+        {"name": "referral_regions", "type": "string[]", "facet": True, "optional": True},
+        {"name": "referral_address", "type": "string", "optional": True, "index": False},
     ],
 }
 # client.collections.create(NOTES_SCHEMA)
@@ -47,6 +80,10 @@ TASKS_SCHEMA = {
         {"name": "referral_id", "type": "int32"},
         {"name": "description", "type": "string", "optional": True},
         {"name": "assigned_user", "type": "string"},
+        {"name": "referral_reference", "type": "string", "optional": True, "index": False},
+        {"name": "referral_type", "type": "string", "facet": True, "optional": True},
+        {"name": "referral_regions", "type": "string[]", "facet": True, "optional": True},
+        {"name": "referral_address", "type": "string", "optional": True, "index": False},
     ],
 }
 # client.collections.create(TASKS_SCHEMA)
@@ -58,6 +95,23 @@ CONDITIONS_SCHEMA = {
         {"name": "referral_id", "type": "int32"},
         {"name": "proposed_condition", "type": "string", "optional": True},
         {"name": "approved_condition", "type": "string", "optional": True},
+        {"name": "referral_reference", "type": "string", "optional": True, "index": False},
+        {"name": "referral_type", "type": "string", "facet": True, "optional": True},
+        {"name": "referral_regions", "type": "string[]", "facet": True, "optional": True},
+        {"name": "referral_address", "type": "string", "optional": True, "index": False},
     ],
 }
 # client.collections.create(CONDITIONS_SCHEMA)
+
+# All schemas, keyed by name.
+SCHEMAS = {
+    schema["name"]: schema
+    for schema in [
+        REFERRALS_SCHEMA,
+        RECORDS_SCHEMA,
+        RECORD_CHUNKS_SCHEMA,
+        NOTES_SCHEMA,
+        TASKS_SCHEMA,
+        CONDITIONS_SCHEMA,
+    ]
+}
@@ -0,0 +1,110 @@
+from typing import Any
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, Q
+
+from indexer.schemas import SCHEMAS
+from indexer.utils import get_collection_queryset
+
+# Text search configuration used by the search_vector database triggers.
+SEARCH_CONFIG = "english"
+# ORM lookups equivalent to the facet fields of each collection, used to filter Postgres search results.
+# Child object collections have facets on the denormalised fields of the parent referral.
+REFERRAL_CONTEXT_LOOKUPS = {
+    "referral_type": "referral__type__name",
+    "referral_regions": "referral__regions__name",
+}
+FACET_LOOKUPS = {
+    "referrals": {
+        "type": "type__name",
+        "referring_org": "referring_org__name",
+        "regions": "regions__name",
+        "lga": "lga__name",
+        "dop_triggers": "dop_triggers__name",
+    },
+    "records": {
+        "file_type": "uploaded_file__iendswith",
+        **REFERRAL_CONTEXT_LOOKUPS,
+    },
+    "notes": REFERRAL_CONTEXT_LOOKUPS,
+    "tasks": REFERRAL_CONTEXT_LOOKUPS,
+    "conditions": REFERRAL_CONTEXT_LOOKUPS,
+}
+
+
+def get_facet_fields(collection: str) -> list[str]:
+    """Return the names of the facet fields declared in the schema of the named collection."""
+    return [field["name"] for field in SCHEMAS[collection]["fields"] if field.get("facet")]
+
+
+def get_facet_filter_by(filters: dict[str, list[str]]) -> str:
+    """Return a Typesense filter_by expression matching any of the passed-in values of each facet field."""
+    clauses = []
+    for field, values in filters.items():
+        # Values are enclosed in backticks, so that they may contain commas and other special characters.
+        values = ",".join(f"`{value.replace('`', '')}`" for value in values)
+        clauses.append(f"{field}:=[{values}]")
+    return " && ".join(clauses)
+
+
+def get_facet_filter_q(collection: str, filters: dict[str, list[str]]) -> Q:
+    """Return a query filtering a collection queryset by the passed-in facet field values (the Postgres equivalent
+    of get_facet_filter_by). Each filter is applied as a subquery, as some facets span many-to-many relationships.
+    """
+    model = get_collection_queryset(collection).model
+    query = Q()
+    for field, values in filters.items():
+        lookup = FACET_LOOKUPS[collection][field]
+        if field == "file_type":
+            field_q = Q()
+            for value in values:
+                field_q |= Q(**{lookup: f".{value}"})
+        else:
+            field_q = Q(**{f"{lookup}__in": values})
+        query &= Q(pk__in=model.objects.filter(field_q).values("pk"))
+    return query
+
+
+def postgres_search(
+    collection: str, q: str, page: int = 1, per_page: int = 20, filters: dict[str, list[str]] | None = None
+) -> dict[str, Any]:
+    """Search the named collection using Postgres full-text search against the search_vector columns,
+    ranked using ts_rank. Returns a result in the same shape as a Typesense search result (found count,
+    plus a list of hits each having a document and highlight), so that either engine may serve a search view.
+    Results may be filtered by facet field values, but facet counts are not returned.
+    """
+    query = SearchQuery(q, search_type="websearch", config=SEARCH_CONFIG)
+    qs = get_collection_queryset(collection).select_related(None).prefetch_related(None).filter(search_vector=query)
+    if filters:
+        qs = qs.filter(get_facet_filter_q(collection, filters))
+    found = qs.count()
+
+    fields = ["pk", "created", "snippet"]
+    if collection != "referrals":
+        fields.append("referral_id")
+    offset = (max(page, 1) - 1) * per_page
+    rows = (
+        qs.annotate(
+            rank=SearchRank(F("search_vector"), query),
+            snippet=SearchHeadline(
+                "search_document",
+                query,
+                config=SEARCH_CONFIG,
+                start_sel="<mark>",
+                stop_sel="</mark>",
+                max_words=30,
+                min_words=15,
+            ),
+        )
+        .order_by("-rank", "-created")
+        .values(*fields)[offset : offset + per_page]
+    )
+
+    hits = []
+    for row in rows:
+        document = {"id": str(row["pk"]), "created": row["created"].timestamp()}
+        if "referral_id" in row:
+            document["referral_id"] = row["referral_id"]
+        hits.append({"document": document, "highlight": {"search_document": {"snippet": row["snippet"]}}})
+
+    return {"found": found, "hits": hits}
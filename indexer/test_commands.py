@@ -0,0 +1,69 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+
+from referral.models import Referral, Task
+from referral.test_models import PrsTestCase
+
+
+class ReconcileIndexTest(PrsTestCase):
+    """Unit tests for the reconcile_index management command."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = mock.MagicMock()
+        self.documents = self.client.collections.__getitem__.return_value.documents
+        self.documents.import_.side_effect = lambda documents, params: [{"success": True} for _ in documents]
+        self.documents.delete.return_value = {"num_deleted": 1}
+        patcher = mock.patch("indexer.management.commands.reconcile_index.get_typesense_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # One task is indexed, plus a stale document for an object which no longer exists.
+        self.tasks = list(Task.objects.current().order_by("pk"))
+        self.documents.export.return_value = "\n".join(json.dumps({"id": i}) for i in [str(self.tasks[0].pk), "999999"])
+
+    def test_reconcile(self):
+        """Test that missing objects are indexed and stale documents are deleted"""
+        out = StringIO()
+        call_command("reconcile_index", "--collection", "tasks", stdout=out)
+        imported = [doc["id"] for call in self.documents.import_.call_args_list for doc in call.args[0]]
+        self.assertEqual(imported, [str(task.pk) for task in self.tasks[1:]])
+        self.documents.delete.assert_called_once_with({"filter_by": "id:[999999]"})
+        self.assertIn(f"{len(self.tasks) - 1} missing, 1 stale", out.getvalue())
+
+    def test_reconcile_dry_run(self):
+        """Test that a dry run reports drift without changing the index"""
+        out = StringIO()
+        call_command("reconcile_index", "--collection", "tasks", "--dry-run", stdout=out)
+        self.documents.import_.assert_not_called()
+        self.documents.delete.assert_not_called()
+        self.assertIn(f"{len(self.tasks) - 1} missing, 1 stale", out.getvalue())
+
+
+class BackfillSearchDocumentsTest(PrsTestCase):
+    """Unit tests for the backfill_search_documents management command."""
+
+    def setUp(self):
+        super().setUp()
+        self.pks = list(Referral.objects.order_by("pk").values_list("pk", flat=True))
+        Referral.objects.update(search_document=None)
+
+    def test_backfill(self):
+        """Test that rows having no search_document are updated in PK-range batches"""
+        out = StringIO()
+        call_command("backfill_search_documents", "--model", "referral", "--batch-size", "1", stdout=out)
+        for ref in Referral.objects.all():
+            self.assertEqual(ref.search_document, ref.get_search_document())
+        self.assertIn(f"referral: backfilled {len(self.pks)} rows", out.getvalue())
+        # Each PK in the range is a separate batch.
+        self.assertEqual(out.getvalue().count("updated, next PK"), self.pks[-1] - self.pks[0] + 1)
+
+    def test_backfill_start_pk(self):
+        """Test that a backfill may be resumed from a PK"""
+        call_command("backfill_search_documents", "--model", "referral", "--start-pk", str(self.pks[-1]), stdout=StringIO())
+        self.assertFalse(Referral.objects.filter(pk__lt=self.pks[-1], search_document__isnull=False).exists())
+        self.assertTrue(Referral.objects.get(pk=self.pks[-1]).search_document)
+        with self.assertRaises(CommandError):
+            call_command("backfill_search_documents", "--start-pk", str(self.pks[-1]), stdout=StringIO())
@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase
+from typesense.exceptions import ObjectNotFound, RequestMalformed, ServiceUnavailable
+
+from indexer.utils import CircuitBreaker
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Unit tests for the Typesense circuit breaker."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(window=10, min_calls=2, failure_ratio=0.5, slow_seconds=10, reset_seconds=60)
+
+    def test_circuit_breaker_failures(self):
+        """Test that the circuit breaker only counts errors indicating that Typesense is unavailable as failures"""
+        for exc in [ObjectNotFound, RequestMalformed, ObjectNotFound]:
+            with self.assertRaises(exc):
+                with self.breaker.call():
+                    raise exc("Client error")
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(sum(self.breaker.outcomes), 0)
+        for _ in range(3):
+            with self.assertRaises(ServiceUnavailable):
+                with self.breaker.call():
+                    raise ServiceUnavailable("Service unavailable")
+        self.assertTrue(self.breaker.is_open)
+
+    def test_circuit_breaker_half_open(self):
+        """Test that the trial call is only claimed when a call is made, and that its outcome closes the breaker"""
+        for _ in range(2):
+            self.breaker.record(True)
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+        # The reset period has elapsed: a trial call is due.
+        self.breaker.opened_at -= self.breaker.reset_seconds
+        self.assertTrue(self.breaker.allow())
+        # No call was made (e.g. nothing to index): the trial remains due, and unrelated outcomes are ignored.
+        self.breaker.record(False)
+        self.assertTrue(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+        # A failed trial call re-opens the breaker for another reset period.
+        with self.assertRaises(ServiceUnavailable):
+            with self.breaker.call():
+                raise ServiceUnavailable("Service unavailable")
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+        # A successful trial call closes the breaker.
+        self.breaker.opened_at -= self.breaker.reset_seconds
+        with self.breaker.call():
+            pass
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
@@ -1,38 +1,191 @@
+import json
+import os
 import re
-from io import BytesIO
+from collections import deque
+from contextlib import contextmanager
+from hashlib import sha256
+from threading import Lock
+from time import monotonic, time_ns
 from typing import Any
 
-import docx2txt
+import httpx
 import typesense
+from django.apps import apps
 from django.conf import settings
-from extract_msg import Message
-from pdfminer import high_level
+from django.core.cache import cache
+from django.db.models import QuerySet
+from typesense.exceptions import HTTPStatus0Error, ObjectNotFound, ServerError, ServiceUnavailable, Timeout, TypesenseClientError
 from unidecode import unidecode
 
+from indexer.schemas import SCHEMAS
 
-def get_typesense_client() -> typesense.Client:
-    """Return a typesense Client object for accessing document collections."""
-    client: typesense.Client = typesense.Client(
+
+# Process-wide Typesense clients, keyed by process ID.
+_clients: dict[int, typesense.Client] = {}
+
+
+class CircuitBreaker:
+    """Per-process circuit breaker for calls to Typesense. The breaker trips (opens) when the proportion of
+    failed or slow calls in a rolling window of recent calls reaches a threshold. While open, calls are
+    not attempted (callers should fall back), until `reset_seconds` have elapsed. A single trial call is then
+    allowed (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, slow_seconds: float, reset_seconds: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.reset_seconds = reset_seconds
+        self.outcomes: deque[bool] = deque(maxlen=window)  # True for a failed or slow call.
+        self.opened_at: float | None = None
+        self.lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Returns True if a call should be attempted: the breaker is closed, or a trial call is due.
+        The trial itself is only claimed once a call is made (by `call()`), so callers which end up
+        not calling Typesense do not hold the breaker open.
+        """
+        with self.lock:
+            return self.opened_at is None or monotonic() - self.opened_at >= self.reset_seconds
+
+    def start_trial(self) -> bool:
+        """Claim the trial call, if the breaker is open and one is due. Returns True if claimed."""
+        with self.lock:
+            if self.opened_at is not None and monotonic() - self.opened_at >= self.reset_seconds:
+                # Allow one trial call per reset period.
+                self.opened_at = monotonic()
+                return True
+            return False
+
+    def record(self, failed: bool, elapsed: float = 0.0, trial: bool = False) -> None:
+        """Record the outcome of a call. Slow calls are counted as failures. The outcome of a trial call
+        closes or re-opens the breaker; other calls completing while the breaker is open are ignored.
+        """
+        failed = failed or elapsed >= self.slow_seconds
+        with self.lock:
+            if trial:
+                if failed:
+                    self.opened_at = monotonic()
+                else:
+                    self.opened_at = None
+                    self.outcomes.clear()
+                return
+            if self.opened_at is not None:
+                return
+            self.outcomes.append(failed)
+            if len(self.outcomes) >= self.min_calls and sum(self.outcomes) / len(self.outcomes) >= self.failure_ratio:
+                self.opened_at = monotonic()
+                self.outcomes.clear()
+
+    @contextmanager
+    def call(self, timed: bool = True):
+        """Context manager to time a call and record its outcome. Exceptions are re-raised.
+        Only exceptions indicating that Typesense is unavailable are recorded as failures; errors caused by
+        the request itself (4xx responses) are not. Pass timed=False for writes, whose duration depends on
+        the number of documents, so that they are never counted as slow.
+        """
+        trial = self.start_trial()
+        start = monotonic()
+        try:
+            yield
+        except Exception as exc:
+            self.record(is_typesense_unavailable(exc), trial=trial)
+            raise
+        self.record(False, monotonic() - start if timed else 0.0, trial=trial)
+
+
+def is_typesense_unavailable(exc: Exception) -> bool:
+    """Returns True if the passed-in exception indicates that Typesense is unavailable: a connection error,
+    a timeout or a 5xx response (unmapped status codes such as 502 raise the base TypesenseClientError).
+    """
+    if isinstance(exc, (httpx.HTTPError, Timeout, HTTPStatus0Error, ServerError, ServiceUnavailable)):
+        return True
+    return type(exc) is TypesenseClientError
+
+
+typesense_breaker = CircuitBreaker(
+    window=int(settings.TYPESENSE_BREAKER_WINDOW),
+    min_calls=int(settings.TYPESENSE_BREAKER_MIN_CALLS),
+    failure_ratio=float(settings.TYPESENSE_BREAKER_FAILURE_RATIO),
+    slow_seconds=float(settings.TYPESENSE_BREAKER_SLOW_SECONDS),
+    reset_seconds=float(settings.TYPESENSE_BREAKER_RESET_SECONDS),
+)
+
+
+def get_typesense_config() -> dict[str, Any]:
+    """Return Typesense client configuration. TYPESENSE_HOST may be a comma-separated list of
+    cluster nodes; unhealthy nodes are skipped until the healthcheck interval has elapsed.
+    """
+    nodes = [
         {
-            "nodes": [
-                {
-                    "host": settings.TYPESENSE_HOST,
-                    "port": settings.TYPESENSE_PORT,
-                    "protocol": settings.TYPESENSE_PROTOCOL,
-                }
-            ],
-            "api_key": settings.TYPESENSE_API_KEY,
-            "connection_timeout_seconds": settings.TYPESENSE_CONN_TIMEOUT,
+            "host": host.strip(),
+            "port": settings.TYPESENSE_PORT,
+            "protocol": settings.TYPESENSE_PROTOCOL,
         }
-    )
+        for host in settings.TYPESENSE_HOST.split(",")
+    ]
+    return {
+        "nodes": nodes,
+        "api_key": settings.TYPESENSE_API_KEY,
+        "connection_timeout_seconds": settings.TYPESENSE_CONN_TIMEOUT,
+        "num_retries": max(int(settings.TYPESENSE_NUM_RETRIES), len(nodes)),
+        "retry_interval_seconds": float(settings.TYPESENSE_RETRY_INTERVAL),
+        "healthcheck_interval_seconds": int(settings.TYPESENSE_HEALTHCHECK_INTERVAL),
+    }
+
+
+def get_typesense_client() -> typesense.Client:
+    """Return a typesense Client object for accessing document collections.
+    The client (and its pool of keep-alive HTTP connections) is created lazily, once per process.
+    A client inherited from a parent process (e.g. gunicorn preload_app, Celery prefork) is never reused.
+    """
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        _clients.clear()
+        client = _clients[pid] = typesense.Client(get_typesense_config())
     return client
 
 
-def typesense_index_referral(ref: Any, client: typesense.Client | None = None) -> None:
-    """Index a single referral in Typesense."""
-    if not client:
-        client = get_typesense_client()
+def get_search_generation(collections: list[str]) -> str:
+    """Return the combined search cache generation of the passed-in collections. Cached search
+    results are keyed on the generation, so that results are invalidated whenever a searched
+    collection changes.
+    """
+    keys = [f"prs:search_generation:{collection}" for collection in collections]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Start a new counter at the current time, so that a counter evicted from the cache
+            # cannot restart at a value used by results that are still cached.
+            cache.add(key, time_ns(), None)
+            generations[key] = cache.get(key, 0)
+    return "-".join(str(generations[key]) for key in keys)
 
+
+def bump_search_generation(*collections: str) -> None:
+    """Invalidate all cached search results of the passed-in collections."""
+    for collection in collections:
+        key = f"prs:search_generation:{collection}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time_ns(), None)
+
+
+def get_search_cache_key(collections: list[str], params: dict[str, Any]) -> str:
+    """Return the cache key for the results of a search of one or more collections."""
+    digest = sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"prs:search:{get_search_generation(collections)}:{digest}"
+
+
+def get_referral_document(ref: Any) -> dict[str, Any]:
+    """Return a Typesense document for a single referral."""
     ref_document = {
         "id": str(ref.pk),
         "created": ref.created.timestamp(),
@@ -46,139 +199,397 @@ def typesense_index_referral(ref: Any, client: typesense.Client | None = None) -
         "dop_triggers": [i.name for i in ref.dop_triggers.all()],
     }
     if ref.point:
-        ref_document["point"] = [ref.point.x, ref.point.y]
-    client.collections["referrals"].documents.upsert(ref_document)
+        # Typesense geopoints are [latitude, longitude].
+        ref_document["point"] = [ref.point.y, ref.point.x]
+    return ref_document
 
 
-def typesense_index_record(rec: Any, client: typesense.Client | None = None) -> None:
-    """Index a single record in Typesense."""
+def get_referral_context(ref: Any) -> dict[str, Any]:
+    """Return the parent referral fields that are denormalised into each child object document,
+    so that child search results may be displayed without querying the database.
+    """
+    if not ref:
+        return {}
+    return {
+        "referral_reference": ref.reference if ref.reference else "",
+        "referral_type": ref.type.name,
+        "referral_regions": [i.name for i in ref.regions.all()],
+        "referral_address": ref.address if ref.address else "",
+    }
+
+
+def typesense_index_referral(ref: Any, client: typesense.Client | None = None) -> None:
+    """Index a single referral in Typesense, and update the referral fields of its child object documents
+    (if those fields have changed).
+    """
     if not client:
         client = get_typesense_client()
 
+    changed = get_changed_referrals([ref], client)
+    client.collections["referrals"].documents.upsert(get_referral_document(ref))
+    bump_search_generation("referrals")
+    if changed:
+        typesense_update_referral_context(ref, client)
+
+
+def get_changed_referrals(refs: list[Any], client: typesense.Client | None = None) -> list[Any]:
+    """Return those referrals whose denormalised child document fields (see get_referral_context) differ
+    from their currently-indexed referral document, using export requests. Call this before the
+    referrals are (re)indexed. New referrals (not yet indexed) are excluded, as their child documents
+    are built from the database.
+    """
+    if not refs:
+        return []
+    if not client:
+        client = get_typesense_client()
+
+    indexed = {}
+    # Export documents in batches, to limit the length of the filter.
+    for i in range(0, len(refs), 250):
+        params = {
+            "filter_by": f"id:[{','.join(str(ref.pk) for ref in refs[i : i + 250])}]",
+            "include_fields": "id,reference,type,regions,address",
+        }
+        for line in client.collections["referrals"].documents.export(params).splitlines():
+            if line:
+                doc = json.loads(line)
+                indexed[doc["id"]] = {
+                    "referral_reference": doc.get("reference", ""),
+                    "referral_type": doc.get("type", ""),
+                    "referral_regions": doc.get("regions", []),
+                    "referral_address": doc.get("address", ""),
+                }
+    return [ref for ref in refs if str(ref.pk) in indexed and indexed[str(ref.pk)] != get_referral_context(ref)]
+
+
+def typesense_update_referral_context(ref: Any, client: typesense.Client | None = None) -> None:
+    """Update the denormalised referral fields of all child object documents of a referral,
+    using one update-by-filter request for each child collection.
+    """
+    if not client:
+        client = get_typesense_client()
+
+    context = get_referral_context(ref)
+    for collection, (model, _) in COLLECTION_MODELS.items():
+        if model != "referral":
+            client.collections[collection].documents.update(context, {"filter_by": f"referral_id:={ref.pk}"})
+            bump_search_generation(collection)
+
+
+def get_record_document(rec: Any) -> dict[str, Any]:
+    """Return a Typesense document for a single record, including any uploaded file content."""
     rec_document: dict[str, Any] = {
         "id": str(rec.pk),
         "created": rec.created.timestamp(),
-        "referral_id": rec.referral.pk,
+        "referral_id": rec.referral_id,
         "name": rec.name,
         "description": rec.description if rec.description else "",
         "file_name": rec.filename,
         "file_type": rec.extension,
+        **get_referral_context(rec.referral),
     }
-    file_content: str = ""
+    # Uploaded file content is extracted once (by the index_record task) and persisted on the record.
+    # If record content is indexed as chunks, it is omitted from the record document.
+    if settings.TYPESENSE_RECORD_CHUNKS:
+        rec_document["file_content"] = ""
+    else:
+        rec_document["file_content"] = normalise_file_content(rec.uploaded_file_content or "")
+    return rec_document
 
-    # PDF document content.
-    if rec.extension == "PDF":
-        try:
-            # PDF text extraction can be a little error-prone.
-            # In the event of an exception here, we'll just accept it and pass.
-            if settings.LOCAL_MEDIA_STORAGE:
-                with open(rec.uploaded_file.path, "rb") as f:
-                    file_content = high_level.extract_text(f)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(rec.uploaded_file.read())
-                file_content = high_level.extract_text(tmp)
-        except:
-            pass
 
-    # MSG document content.
-    if rec.extension == "MSG":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                message = Message(rec.uploaded_file.path)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(rec.uploaded_file.read())
-                message = Message(tmp)
-            file_content = f"{message.subject} {message.body}"
-        except:
-            pass
+def normalise_file_content(file_content: str) -> str:
+    """Trim down file content a little to aid indexing."""
+    if not file_content:
+        return ""
+    # Replace punctuation with a space.
+    file_content = re.sub(r"[^\w\s]", " ", file_content)
+    # Replace newlines with a space.
+    file_content = file_content.replace("\r", "").replace("\n", " ")
+    # Replace multiple spaces with a single one.
+    file_content = re.sub(r"\s+", " ", file_content)
+    file_content = file_content.strip()
+    # Transliterate some unicode characters to ASCII.
+    return unidecode(file_content)
 
-    # DOCX document content.
-    if rec.extension == "DOCX":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                file_content = docx2txt.process(rec.uploaded_file.path)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(rec.uploaded_file.read())
-                file_content = docx2txt.process(tmp)
-        except:
-            pass
 
-    # TXT document content.
-    if rec.extension == "TXT":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                with open(rec.uploaded_file.path, "r") as f:
-                    file_content = f.read()
-            else:
-                # Read the upload blob content directly.
-                file_content = rec.uploaded_file.read()
-        except:
-            pass
+def split_file_content(file_content: str, size: int) -> list[tuple[int, str]]:
+    """Split file content into a list of (page number, text) chunks. Content is split on page breaks
+    (form feed characters), then any page longer than `size` characters is split further on word boundaries.
+    Content without page breaks is treated as a single page.
+    """
+    chunks = []
+    for page_no, page in enumerate(file_content.split("\x0c"), start=1):
+        page = normalise_file_content(page)
+        while len(page) > size:
+            split = page.rfind(" ", 0, size)
+            if split < 1:
+                split = size
+            chunks.append((page_no, page[:split]))
+            page = page[split:].strip()
+        if page:
+            chunks.append((page_no, page))
+    return chunks
 
-    # Trim down the file content a little to aid indexing.
-    if file_content:
-        # Decode a bytes object to a string.
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode("utf-8")
-        # Replace punctuation with a space.
-        file_content = re.sub(r"[^\w\s]", " ", file_content)
-        # Replace newlines with a space.
-        file_content = file_content.replace("\r", "").replace("\n", " ")
-        # Replace multiple spaces with a single one.
-        file_content = re.sub(r"\s+", " ", file_content)
-        file_content = file_content.strip()
-        # Transliterate some unicode characters to ASCII.
-        file_content = unidecode(file_content)
-
-    rec_document["file_content"] = file_content
-    client.collections["records"].documents.upsert(rec_document)
 
+def get_record_chunk_documents(rec: Any) -> list[dict[str, Any]]:
+    """Return a list of Typesense documents for a single record, one for each chunk of uploaded file content.
+    A record always has at least one chunk document, so that it may be found by name or description.
+    """
+    size = int(settings.TYPESENSE_RECORD_CHUNK_SIZE) * 1024
+    chunks = split_file_content(rec.uploaded_file_content or "", size) or [(1, "")]
+    referral_context = get_referral_context(rec.referral)
+    return [
+        {
+            "id": f"{rec.pk}_{i}",
+            "created": rec.created.timestamp(),
+            "record_id": rec.pk,
+            "referral_id": rec.referral_id,
+            "name": rec.name,
+            "description": rec.description if rec.description else "",
+            "file_name": rec.filename,
+            "page": page_no,
+            "file_content": text,
+            **referral_context,
+        }
+        for i, (page_no, text) in enumerate(chunks)
+    ]
 
-def typesense_index_note(note: Any, client: typesense.Client | None = None) -> None:
-    """Index a single note in Typesense."""
+
+def typesense_index_record(rec: Any, client: typesense.Client | None = None) -> None:
+    """Index a single record in Typesense, plus its content chunks if enabled."""
     if not client:
         client = get_typesense_client()
 
+    client.collections["records"].documents.upsert(get_record_document(rec))
+    bump_search_generation("records")
+
+    if settings.TYPESENSE_RECORD_CHUNKS:
+        # Remove any existing chunks first, as the record may now have fewer.
+        client.collections["record_chunks"].documents.delete({"filter_by": f"record_id:={rec.pk}"})
+        typesense_import_documents("record_chunks", get_record_chunk_documents(rec), client)
+        bump_search_generation("record_chunks")
+
+
+def get_note_document(note: Any) -> dict[str, Any]:
+    """Return a Typesense document for a single note."""
     note_document: dict[str, Any] = {
         "id": str(note.pk),
         "created": note.created.timestamp(),
-        "referral_id": note.referral.pk,
+        "referral_id": note.referral_id,
         "note": note.note,
+        **get_referral_context(note.referral),
     }
-    client.collections["notes"].documents.upsert(note_document)
+    return note_document
 
 
-def typesense_index_task(task: Any, client: typesense.Client | None = None) -> None:
-    """Index a single task in Typesense."""
+def typesense_index_note(note: Any, client: typesense.Client | None = None) -> None:
+    """Index a single note in Typesense."""
     if not client:
         client = get_typesense_client()
 
+    client.collections["notes"].documents.upsert(get_note_document(note))
+    bump_search_generation("notes")
+
+
+def get_task_document(task: Any) -> dict[str, Any]:
+    """Return a Typesense document for a single task."""
     task_document: dict[str, Any] = {
         "id": str(task.pk),
         "created": task.created.timestamp(),
-        "referral_id": task.referral.pk,
+        "referral_id": task.referral_id,
         "description": task.description if task.description else "",
         "assigned_user": task.assigned_user.get_full_name(),
+        **get_referral_context(task.referral),
     }
-    client.collections["tasks"].documents.upsert(task_document)
+    return task_document
 
 
-def typesense_index_condition(con: Any, client: typesense.Client | None = None) -> None:
-    """Index a single condition in Typesense."""
+def typesense_index_task(task: Any, client: typesense.Client | None = None) -> None:
+    """Index a single task in Typesense."""
     if not client:
         client = get_typesense_client()
 
+    client.collections["tasks"].documents.upsert(get_task_document(task))
+    bump_search_generation("tasks")
+
+
+def get_condition_document(con: Any) -> dict[str, Any]:
+    """Return a Typesense document for a single condition."""
     condition_document: dict[str, Any] = {
         "id": str(con.pk),
         "created": con.created.timestamp(),
-        "referral_id": con.referral.pk if con.referral else None,
+        "referral_id": con.referral_id,
         "proposed_condition": con.proposed_condition if con.proposed_condition else "",
         "approved_condition": con.condition if con.condition else "",
+        **get_referral_context(con.referral),
     }
-    client.collections["conditions"].documents.upsert(condition_document)
+    return condition_document
+
+
+def typesense_index_condition(con: Any, client: typesense.Client | None = None) -> None:
+    """Index a single condition in Typesense."""
+    if not client:
+        client = get_typesense_client()
+
+    client.collections["conditions"].documents.upsert(get_condition_document(con))
+    bump_search_generation("conditions")
+
+
+def typesense_import_documents(collection: str, documents: list[dict[str, Any]], client: typesense.Client | None = None) -> list[str]:
+    """Bulk upsert a list of documents into a Typesense collection using the JSONL import
+    endpoint (a single HTTP request). Returns a list of document IDs that failed to import.
+    """
+    if not documents:
+        return []
+
+    if not client:
+        client = get_typesense_client()
+
+    results = client.collections[collection].documents.import_(documents, {"action": "upsert"})
+    bump_search_generation(collection)
+    # The import response is a list of results, in the same order as the imported documents.
+    failed_ids = [doc["id"] for doc, result in zip(documents, results) if not result.get("success")]
+    return failed_ids
+
+
+# Map each Typesense collection to the referral app model that it indexes, and the function returning a document.
+COLLECTION_MODELS = {
+    "referrals": ("referral", get_referral_document),
+    "records": ("record", get_record_document),
+    "notes": ("note", get_note_document),
+    "tasks": ("task", get_task_document),
+    "conditions": ("condition", get_condition_document),
+}
+if settings.TYPESENSE_RECORD_CHUNKS:
+    # Each record is indexed as one or more chunk documents.
+    COLLECTION_MODELS["record_chunks"] = ("record", get_record_chunk_documents)
+
+
+def get_model_collections(model: str) -> list[str]:
+    """Return the names of the collections that index the passed-in referral app model."""
+    return [collection for collection, (collection_model, _) in COLLECTION_MODELS.items() if collection_model == model]
+
+
+def collapse_grouped_hits(search_result: dict[str, Any]) -> list[dict[str, Any]]:
+    """For a record_chunks search result grouped by record_id, return a list containing the best-matching
+    chunk hit for each record, having the record ID as its document ID.
+    """
+    hits = []
+    for group in search_result["grouped_hits"]:
+        hit = group["hits"][0]
+        hit["document"]["id"] = str(hit["document"]["record_id"])
+        hits.append(hit)
+    return hits
+
+
+def get_collection_queryset(collection: str) -> QuerySet:
+    """Return a queryset of current objects to be indexed in the named Typesense collection,
+    with related objects used by the document functions fetched up front.
+    """
+    model = apps.get_model("referral", COLLECTION_MODELS[collection][0])
+    qs = model.objects.current()
+
+    if collection == "referrals":
+        qs = qs.select_related("type", "referring_org", "lga").prefetch_related("regions", "dop_triggers")
+    else:
+        # Child object documents include fields of the parent referral.
+        qs = qs.select_related("referral__type").prefetch_related("referral__regions")
+    if collection == "tasks":
+        qs = qs.select_related("assigned_user")
+    elif collection == "conditions":
+        # Conditions without a referral are "model" conditions, and are not indexed.
+        qs = qs.filter(referral__isnull=False)
+
+    return qs.order_by("pk")
+
+
+def get_indexed_ids(collection: str, client: typesense.Client | None = None) -> set[str]:
+    """Return the set of all document IDs in a Typesense collection, exported as JSONL
+    (a single streamed HTTP request) including only the id field.
+    """
+    if not client:
+        client = get_typesense_client()
+
+    export = client.collections[collection].documents.export({"include_fields": "id"})
+    return {json.loads(line)["id"] for line in export.splitlines() if line}
+
+
+def typesense_delete_documents(collection: str, ids: list[str], client: typesense.Client | None = None, field: str = "id") -> int:
+    """Delete the documents having the passed-in IDs (in `field`) from a Typesense collection, using a single
+    filtered delete request. Returns the number of documents deleted.
+    """
+    if not ids:
+        return 0
+    if not client:
+        client = get_typesense_client()
+
+    result = client.collections[collection].documents.delete({"filter_by": f"{field}:[{','.join(ids)}]"})
+    bump_search_generation(collection)
+    return result.get("num_deleted", 0)
+
+
+def typesense_unindex_object(model: str, pk: int, client: typesense.Client | None = None) -> int:
+    """Remove the document for a single (deleted) object from Typesense. For a referral, the documents of all
+    child objects are also removed, using one filtered delete (by referral_id) for each collection.
+    Returns the total number of documents deleted.
+    """
+    if not client:
+        client = get_typesense_client()
+
+    deleted = 0
+    for collection, (collection_model, _) in COLLECTION_MODELS.items():
+        if collection_model == model and collection != "record_chunks":
+            deleted += typesense_delete_documents(collection, [str(pk)], client)
+        elif model == "referral":
+            deleted += typesense_delete_documents(collection, [str(pk)], client, field="referral_id")
+
+    if model == "record" and settings.TYPESENSE_RECORD_CHUNKS:
+        deleted += typesense_delete_documents("record_chunks", [str(pk)], client, field="record_id")
+
+    return deleted
+
+
+def get_alias_collection(name: str, client: typesense.Client | None = None) -> str | None:
+    """Return the name of the collection that a Typesense alias points to, or None if the alias doesn't exist."""
+    if not client:
+        client = get_typesense_client()
+
+    try:
+        return client.aliases[name].retrieve()["collection_name"]
+    except ObjectNotFound:
+        return None
+
+
+def create_versioned_collection(name: str, client: typesense.Client | None = None) -> str:
+    """Create a new, empty versioned collection (e.g. referrals_v7) using the named schema,
+    and return the name of the new collection.
+    """
+    if not client:
+        client = get_typesense_client()
+
+    pattern = re.compile(rf"^{re.escape(name)}_v(\d+)$")
+    versions = [int(m.group(1)) for c in client.collections.retrieve() if (m := pattern.match(c["name"]))]
+    collection_name = f"{name}_v{max(versions, default=0) + 1}"
+    client.collections.create({**SCHEMAS[name], "name": collection_name})
+    return collection_name
+
+
+def swap_collection_alias(name: str, collection_name: str, client: typesense.Client | None = None) -> str | None:
+    """Atomically point the named alias at a collection, and return the name of the collection
+    that it previously pointed to (if any).
+    """
+    if not client:
+        client = get_typesense_client()
+
+    old_collection = get_alias_collection(name, client)
+    if not old_collection:
+        # A collection may exist having the same name as the alias (i.e. created prior to
+        # the use of aliases). It needs to be dropped before the alias can be created.
+        try:
+            client.collections[name].delete()
+        except ObjectNotFound:
+            pass
+
+    client.aliases.upsert(name, {"collection_name": collection_name})
+    bump_search_generation(name)
+    return old_collection
@@ -196,6 +196,12 @@ else:
         }
     }
 API_RESPONSE_CACHE_SECONDS = env("API_RESPONSE_CACHE_SECONDS", 60)
+# Object list views: seconds to cache the count of a filtered list (0 to disable), and the
+# estimated list size above which unfiltered lists use the estimate instead of a count (0 to disable).
+LIST_COUNT_CACHE_SECONDS = env("LIST_COUNT_CACHE_SECONDS", 60)
+LIST_COUNT_ESTIMATE_THRESHOLD = env("LIST_COUNT_ESTIMATE_THRESHOLD", 100000)
+# Seconds to cache the rendered child object tabs of the referral details page (invalidated when tab objects are modified).
+REFERRAL_TAB_CACHE_SECONDS = env("REFERRAL_TAB_CACHE_SECONDS", 300)
 
 # Email settings
 EMAIL_HOST = env("EMAIL_HOST", "email.host")
@@ -301,15 +307,42 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Typesense config
 TYPESENSE_API_KEY = env("TYPESENSE_API_KEY", "PlaceholderAPIKey")
-TYPESENSE_HOST = env("TYPESENSE_HOST", "localhost")
+TYPESENSE_HOST = env("TYPESENSE_HOST", "localhost")  # Comma-separated list for a multi-node cluster
 TYPESENSE_PORT = env("TYPESENSE_PORT", 8108)
 TYPESENSE_PROTOCOL = env("TYPESENSE_PROTOCOL", "http")
 TYPESENSE_CONN_TIMEOUT = env("TYPESENSE_CONN_TIMEOUT", 2)
+TYPESENSE_NUM_RETRIES = env("TYPESENSE_NUM_RETRIES", 3)
+TYPESENSE_RETRY_INTERVAL = env("TYPESENSE_RETRY_INTERVAL", 0.1)  # Seconds
+TYPESENSE_HEALTHCHECK_INTERVAL = env("TYPESENSE_HEALTHCHECK_INTERVAL", 60)  # Seconds
+# Typesense circuit breaker: trips when at least FAILURE_RATIO of the last WINDOW calls (minimum MIN_CALLS)
+# failed or took longer than SLOW_SECONDS, then falls back to Postgres search for RESET_SECONDS.
+TYPESENSE_BREAKER_WINDOW = env("TYPESENSE_BREAKER_WINDOW", 20)
+TYPESENSE_BREAKER_MIN_CALLS = env("TYPESENSE_BREAKER_MIN_CALLS", 5)
+TYPESENSE_BREAKER_FAILURE_RATIO = env("TYPESENSE_BREAKER_FAILURE_RATIO", 0.5)
+TYPESENSE_BREAKER_SLOW_SECONDS = env("TYPESENSE_BREAKER_SLOW_SECONDS", 2.0)
+TYPESENSE_BREAKER_RESET_SECONDS = env("TYPESENSE_BREAKER_RESET_SECONDS", 30)
+# Default engine for IndexSearch views: typesense or postgres (full-text search using search_vector columns).
+SEARCH_ENGINE = env("SEARCH_ENGINE", "typesense")
+# Seconds to cache search results (0 to disable). Cached results are invalidated whenever a searched collection is updated.
+SEARCH_CACHE_SECONDS = env("SEARCH_CACHE_SECONDS", 300)
+# Seconds to cache typeahead suggestion results.
+SUGGEST_CACHE_SECONDS = env("SUGGEST_CACHE_SECONDS", 30)
+# Index record file content as page-sized chunks (record_chunks collection), instead of a single document field.
+TYPESENSE_RECORD_CHUNKS = env("TYPESENSE_RECORD_CHUNKS", False)
+TYPESENSE_RECORD_CHUNK_SIZE = env("TYPESENSE_RECORD_CHUNK_SIZE", 16)  # Maximum chunk size, in KB
+
+# Uploaded file text extraction limits (each file is extracted in a separate child process).
+EXTRACTION_TIMEOUT = env("EXTRACTION_TIMEOUT", 120)  # Seconds
+EXTRACTION_MEMORY_LIMIT = env("EXTRACTION_MEMORY_LIMIT", 1024)  # Megabytes
+EXTRACTION_PAGE_LIMIT = env("EXTRACTION_PAGE_LIMIT", 100)  # PDF pages
 
 # Celery config
 BROKER_URL = env("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = "django-db"
 CELERY_TIMEZONE = TIME_ZONE
+# Coalescing search index queue: object saves within INDEX_QUEUE_DELAY seconds are indexed in one bulk import.
+INDEX_QUEUE_URL = env("INDEX_QUEUE_URL", BROKER_URL)
+INDEX_QUEUE_DELAY = env("INDEX_QUEUE_DELAY", 5)
 
 
 def sentry_excluded_exceptions(event, hint):
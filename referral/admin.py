@@ -177,6 +177,7 @@ class RecordAdmin(ReferralBaseModelAdmin):
     )
     raw_id_fields = ReferralBaseModelAdmin.raw_id_fields + ["referral", "notes"]
     date_hierarchy = "created"
+    list_filter = ("uploaded_file_extraction",)
     search_fields = ("id", "name", "infobase_id", "description")
 
     def referral_url(self, instance):
@@ -0,0 +1,72 @@
+"""Uploaded file text extraction, run in a separate child process for each file so that a
+pathological document cannot hang or exhaust the memory of the calling (Celery worker) process.
+
+This module must not import Django, so that the child process starts quickly.
+
+Usage: python -m referral.extract <extension> <page_limit> < file > content
+"""
+
+import sys
+from io import BytesIO
+from typing import Any
+
+import docx2txt
+from extract_msg import Message
+from pdfminer import high_level
+
+# Child process exit codes.
+EXIT_ERROR = 1
+EXIT_OOM = 2
+
+
+def extract_file_content(file: Any, extension: str, page_limit: int = 0) -> str:
+    """Takes in a file object and extension, and returns the file's text content (for a given set of file types).
+    For PDF documents, only the first `page_limit` pages are extracted (0 for no limit).
+    Exceptions raised by the document parsers are not caught here.
+    """
+    file_content = ""
+
+    # PDF document content.
+    if extension == "PDF":
+        file_content = high_level.extract_text(file, maxpages=page_limit)
+
+    # MSG document content.
+    if extension == "MSG":
+        message = Message(file)
+        file_content = f"{message.subject} {message.body}"
+
+    # DOCX document content.
+    if extension == "DOCX":
+        file_content = docx2txt.process(file)
+
+    # TXT document content.
+    if extension == "TXT":
+        file_content = file.read()
+
+    # Decode any bytes object to a string and remove leading/trailing whitespace.
+    if isinstance(file_content, bytes):
+        file_content = file_content.decode("utf-8", errors="ignore").strip()
+
+    # Remove any NUL (0x00) characters. Form feed (0x0c) characters are retained as page breaks.
+    file_content = file_content.replace("\x00", "")
+    return file_content
+
+
+def main(argv: list[str]) -> int:
+    extension, page_limit = argv[0], int(argv[1])
+    # A file passed as stdin can be parsed in place; a pipe must be read into memory to be seekable.
+    file = sys.stdin.buffer if sys.stdin.buffer.seekable() else BytesIO(sys.stdin.buffer.read())
+    try:
+        file_content = extract_file_content(file, extension, page_limit)
+    except MemoryError:
+        return EXIT_OOM
+    except Exception as e:
+        sys.stderr.write(f"{e.__class__.__name__}: {e}")
+        return EXIT_ERROR
+
+    sys.stdout.buffer.write(file_content.encode("utf-8", errors="ignore"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
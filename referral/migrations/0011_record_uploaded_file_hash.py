@@ -0,0 +1,18 @@
+# Generated by Django 5.2.17 on 2026-10-18 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0010_alter_agency_created_alter_agency_effective_to_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='uploaded_file_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='SHA-256 hex digest of the uploaded file, used to extract the text content of each unique file only once.', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.17 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0011_record_uploaded_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='uploaded_file_extraction',
+            field=models.CharField(blank=True, choices=[('ok', 'OK'), ('timeout', 'Timed out'), ('oom', 'Memory limit exceeded'), ('error', 'Error')], editable=False, help_text='Outcome of the uploaded file text content extraction.', max_length=16, null=True),
+        ),
+    ]
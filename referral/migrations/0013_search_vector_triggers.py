@@ -0,0 +1,24 @@
+from django.db import migrations
+
+# Tables having search_document and search_vector columns.
+TABLES = ["referral_referral", "referral_task", "referral_record", "referral_note", "referral_condition"]
+
+# Keep each row's search_vector in sync with its search_document on insert/update.
+# Existing rows are filled by the backfill_search_documents command, not in this migration.
+CREATE_TRIGGER = """
+CREATE TRIGGER {table}_search_vector_update BEFORE INSERT OR UPDATE OF search_document ON {table}
+FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.english', search_document);
+"""
+DROP_TRIGGER = "DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table};"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referral', '0012_record_uploaded_file_extraction'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER.format(table=table), reverse_sql=DROP_TRIGGER.format(table=table))
+        for table in TABLES
+    ]
@@ -0,0 +1,92 @@
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+def trigram_index(field, name):
+    return django.contrib.postgres.indexes.GinIndex(
+        django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(field), name="gin_trgm_ops"),
+        name=name,
+    )
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently (outside of a transaction), so that writes to each table are not blocked.
+    atomic = False
+
+    dependencies = [
+        ('referral', '0013_search_vector_triggers'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=trigram_index('reference', 'idx_referral_reference_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=trigram_index('file_no', 'idx_referral_file_no_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=trigram_index('description', 'idx_referral_description_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=trigram_index('address', 'idx_referral_address_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='task',
+            index=trigram_index('description', 'idx_task_description_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='record',
+            index=trigram_index('name', 'idx_record_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='record',
+            index=trigram_index('infobase_id', 'idx_record_infobase_id_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='record',
+            index=trigram_index('description', 'idx_record_description_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='note',
+            index=trigram_index('note', 'idx_note_note_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='condition',
+            index=trigram_index('condition', 'idx_condition_condition_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('road_name', 'idx_location_road_name_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('locality', 'idx_location_locality_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('address_string', 'idx_location_address_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('lot_no', 'idx_location_lot_no_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('road_suffix', 'idx_location_road_suffix_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=trigram_index('postcode', 'idx_location_postcode_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='location',
+            index=models.Index(fields=['address_no'], name='idx_location_address_no'),
+        ),
+    ]
@@ -9,11 +9,12 @@ from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import GeometryCollection
 from django.contrib.postgres.fields import ArrayField
-from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.postgres.search import SearchVectorField
 from django.core.mail import EmailMultiAlternatives
 from django.core.validators import MaxLengthValidator
 from django.db.models import Q
+from django.db.models.functions import Upper
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.html import SafeString, escape, format_html
@@ -33,7 +34,7 @@ from unidecode import unidecode
 
 from indexer.utils import get_typesense_client
 from referral.base import ActiveModelMixin, AuditMixin
-from referral.tasks import index_object, index_record
+from referral.tasks import queue_index_object, unindex_object
 from referral.utils import as_row_subtract_referral_cell, dewordify_text, get_srs_wgs84, search_document_normalise, smart_truncate
 
 LOGGER = logging.getLogger("prs")
@@ -48,6 +49,20 @@ AU_STATE_CHOICES = (
     (7, "VIC"),
     (8, "WA"),
 )
+# Models having documents in the search index.
+INDEXED_MODELS = ("referral", "record", "task", "note", "condition")
+# Outcome choices for uploaded file text extraction.
+EXTRACTION_CHOICES = (
+    ("ok", "OK"),
+    ("timeout", "Timed out"),
+    ("oom", "Memory limit exceeded"),
+    ("error", "Error"),
+)
+
+
+def trigram_index(field: str, name: str) -> GinIndex:
+    """Returns a GIN trigram index on UPPER(field), usable by case-insensitive (icontains) lookups."""
+    return GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name)
 
 
 class ReferralLookup(ActiveModelMixin, AuditMixin, models.Model):
@@ -346,6 +361,19 @@ class ReferralBaseModel(ActiveModelMixin, AuditMixin, models.Model):
         """Return the path to a model class template include."""
         return f"referral/{cls._meta.model_name}_tools.html"
 
+    def delete(self, unindex=True, **kwargs):
+        """Overide delete() to remove the soft-deleted object from the search index.
+        Pass unindex=False where the removal is handled in bulk (e.g. referral child objects).
+        """
+        super().delete(**kwargs)
+
+        if unindex and self._meta.model_name in INDEXED_MODELS:
+            try:
+                unindex_object.delay_on_commit(pk=self.pk, model=self._meta.model_name)
+            except Exception:
+                # Indexing failure should never block or return an exception. Log the error to stdout.
+                LOGGER.exception(f"Error removing {self} from the index")
+
 
 @reversion.register()
 class Referral(ReferralBaseModel):
@@ -434,7 +462,13 @@ class Referral(ReferralBaseModel):
 
     class Meta:
         ordering = ["-created"]
-        indexes = [GinIndex(fields=["search_vector"], name="idx_referral_search_vector")]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="idx_referral_search_vector"),
+            trigram_index("reference", "idx_referral_reference_trgm"),
+            trigram_index("file_no", "idx_referral_file_no_trgm"),
+            trigram_index("description", "idx_referral_description_trgm"),
+            trigram_index("address", "idx_referral_address_trgm"),
+        ]
 
     @classmethod
     def get_headers(cls):
@@ -450,6 +484,12 @@ class Referral(ReferralBaseModel):
             "Type",
         ]
 
+    def get_search_document(self):
+        """Return the normalised search_document field value for this object."""
+        return search_document_normalise(
+            f"{self.reference} {self.type.name} {self.referring_org.name} {self.address or ''} {self.file_no or ''} {self.description or ''}"
+        )
+
     def save(self, *args, **kwargs):
         """Overide save to cleanse text input to the description, address fields.
         Set the point field value based on any assocated Location objects to the centroid.
@@ -465,14 +505,13 @@ class Referral(ReferralBaseModel):
         if self.pk:
             self.regions_str = self.get_regions_str()
 
-        self.search_document = f"{self.reference} {self.type.name} {self.referring_org.name} {self.address or ''} {self.file_no or ''} {self.description or ''}"
-        self.search_document = search_document_normalise(self.search_document)
+        self.search_document = self.get_search_document()
 
         super().save(*args, **kwargs)
 
         # Index the referral.
         try:
-            index_object.delay_on_commit(pk=self.pk, model="referral")
+            queue_index_object(pk=self.pk, model="referral")
         except Exception:
             # Indexing failure should never block or return an exception. Log the error to stdout.
             LOGGER.exception(f"Error during indexing referral {self}")
@@ -748,7 +787,10 @@ class Task(ReferralBaseModel):
 
     class Meta:
         ordering = ["-pk", "due_date"]
-        indexes = [GinIndex(fields=["search_vector"], name="idx_task_search_vector")]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="idx_task_search_vector"),
+            trigram_index("description", "idx_task_description_trgm"),
+        ]
 
     @classmethod
     def get_headers(cls):
@@ -780,16 +822,19 @@ class Task(ReferralBaseModel):
             "Actions",
         ]
 
+    def get_search_document(self):
+        """Return the normalised search_document field value for this object."""
+        return search_document_normalise(f"{self.type.name} {self.description or ''}")
+
     def save(self, *args, **kwargs):
         """Overide save() to cleanse and populate the search_document field."""
-        self.search_document = f"{self.type.name} {self.description or ''}"
-        self.search_document = search_document_normalise(self.search_document)
+        self.search_document = self.get_search_document()
 
         super().save(*args, **kwargs)
 
         # Index the task.
         try:
-            index_object.delay_on_commit(pk=self.pk, model="task")
+            queue_index_object(pk=self.pk, model="task")
         except Exception:
             # Indexing failure should never block or return an exception. Log the error to stdout.
             LOGGER.exception(f"Error during indexing task {self}")
@@ -1089,12 +1134,33 @@ class Record(ReferralBaseModel):
     )
     notes = models.ManyToManyField("Note", blank=True)
     uploaded_file_content = models.TextField(blank=True, null=True, editable=False)
+    uploaded_file_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True,
+        help_text="SHA-256 hex digest of the uploaded file, used to extract the text content of each unique file only once.",
+    )
+    uploaded_file_extraction = models.CharField(
+        max_length=16,
+        choices=EXTRACTION_CHOICES,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Outcome of the uploaded file text content extraction.",
+    )
     search_document = models.TextField(blank=True, null=True, editable=False)
     search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["-created"]
-        indexes = [GinIndex(fields=["search_vector"], name="idx_record_search_vector")]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="idx_record_search_vector"),
+            trigram_index("name", "idx_record_name_trgm"),
+            trigram_index("infobase_id", "idx_record_infobase_id_trgm"),
+            trigram_index("description", "idx_record_description_trgm"),
+        ]
 
     def __str__(self):
         return f"Record {self.pk} ({smart_truncate(self.name, length=256)})"
@@ -1104,26 +1170,47 @@ class Record(ReferralBaseModel):
         """Return a list of string values as headers for any list view."""
         return ["Record ID", "Date", "Name", "Infobase ID", "Referral ID", "Type", "Size"]
 
+    def get_search_document(self):
+        """Return the normalised search_document field value for this object."""
+        return search_document_normalise(
+            f"{self.name} {self.infobase_id or ''} {self.uploaded_file_content or ''} {self.description or ''}"
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the stored uploaded file name, so that a replaced file can be detected on save.
+        if "uploaded_file" in field_names:
+            instance._uploaded_file_name = instance.uploaded_file.name
+        return instance
+
     def save(self, index=True, **kwargs):
         """Overide save() to cleanse text input fields and populate the search_document field."""
         self.name = unidecode(self.name).replace("\r\n", "").strip()
 
         # If the file is a .MSG we take the sent date of the email and use it for order_date.
-        if self.extension == "MSG":
+        if self.extension == "MSG" and not self.order_date:  # Don't override any existing order_date.
             msg = Message(self.uploaded_file)
-            if msg.date and not self.order_date:  # Don't override any existing order_date.
+            if msg.date:
                 self.order_date = msg.date
 
-        self.search_document = f"{self.name} {self.infobase_id or ''} {self.uploaded_file_content or ''} {self.description or ''}"
-        self.search_document = search_document_normalise(self.search_document)
+        # A newly-uploaded, replaced (e.g. assigned a stored file name) or removed file invalidates any
+        # previously-extracted content.
+        replaced = hasattr(self, "_uploaded_file_name") and self.uploaded_file.name != self._uploaded_file_name
+        if not self.uploaded_file or not self.uploaded_file._committed or replaced:
+            self.uploaded_file_content = None
+            self.uploaded_file_hash = None
+            self.uploaded_file_extraction = None
+
+        self.search_document = self.get_search_document()
 
         super().save(**kwargs)
+        self._uploaded_file_name = self.uploaded_file.name
 
-        # Index the record file content.
+        # Extract the record file content (if required) and index the record.
         try:
             if index:
-                index_object.delay_on_commit(pk=self.pk, model="record")
-                index_record.delay_on_commit(pk=self.pk)
+                queue_index_object(pk=self.pk, model="record")
         except Exception:
             # Indexing failure should never block or return an exception. Log the error to stdout.
             LOGGER.exception(f"Error indexing record {self}")
@@ -1305,7 +1392,10 @@ class Note(ReferralBaseModel):
 
     class Meta:
         ordering = ["order_date"]
-        indexes = [GinIndex(fields=["search_vector"], name="idx_note_search_vector")]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="idx_note_search_vector"),
+            trigram_index("note", "idx_note_note_trgm"),
+        ]
 
     def __str__(self):
         return self.short_note
@@ -1315,6 +1405,10 @@ class Note(ReferralBaseModel):
         """Return a list of string values as headers for any list view."""
         return ["Note ID", "Type", "Creator", "Date", "Note text", "Referral ID"]
 
+    def get_search_document(self):
+        """Return the normalised search_document field value for this object."""
+        return search_document_normalise(f"{self.note}")
+
     def save(self, *args, **kwargs):
         """Overide the Note model save() to cleanse the HTML used and populate the search_document field."""
         self.note_html = dewordify_text(self.note_html)
@@ -1325,14 +1419,13 @@ class Note(ReferralBaseModel):
             t = fromstring(self.note_html)
             self.note = t.text_content().strip()
 
-        self.search_document = f"{self.note}"
-        self.search_document = search_document_normalise(self.search_document)
+        self.search_document = self.get_search_document()
 
         super().save(*args, **kwargs)
 
         # Index the note.
         try:
-            index_object.delay_on_commit(pk=self.pk, model="note")
+            queue_index_object(pk=self.pk, model="note")
         except Exception:
             # Indexing failure should never block or return an exception. Log the error to stdout.
             LOGGER.exception(f"Error during indexing note {self}")
@@ -1493,7 +1586,10 @@ class Condition(ReferralBaseModel):
 
     class Meta:
         ordering = ["-created"]
-        indexes = [GinIndex(fields=["search_vector"], name="idx_condition_search_vector")]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="idx_condition_search_vector"),
+            trigram_index("condition", "idx_condition_condition_trgm"),
+        ]
 
     @classmethod
     def get_headers(cls):
@@ -1507,6 +1603,10 @@ class Condition(ReferralBaseModel):
             "Referral ID",
         ]
 
+    def get_search_document(self):
+        """Return the normalised search_document field value for this object."""
+        return search_document_normalise(f"{self.condition} {self.proposed_condition} {self.identifier}")
+
     def save(self, *args, **kwargs):
         """Overide the Condition models's save() to cleanse the HTML input and populate the search_document field."""
         if self.condition_html:
@@ -1528,15 +1628,14 @@ class Condition(ReferralBaseModel):
             self.proposed_condition_html = ""
             self.proposed_condition = ""
 
-        self.search_document = f"{self.condition} {self.proposed_condition} {self.identifier}"
-        self.search_document = search_document_normalise(self.search_document)
+        self.search_document = self.get_search_document()
 
         super().save(*args, **kwargs)
 
         # Index the condition.
         if self.referral:
             try:
-                index_object.delay_on_commit(pk=self.pk, model="condition")
+                queue_index_object(pk=self.pk, model="condition")
             except Exception:
                 LOGGER.exception(f"Error during indexing condition {self}")
 
@@ -1778,6 +1877,18 @@ class Location(ReferralBaseModel):
     poly = models.PolygonField(srid=4283, null=True, blank=True, help_text="Optional.")
     address_string = models.TextField(null=True, blank=True, editable=True)
 
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            trigram_index("road_name", "idx_location_road_name_trgm"),
+            trigram_index("locality", "idx_location_locality_trgm"),
+            trigram_index("address_string", "idx_location_address_trgm"),
+            trigram_index("lot_no", "idx_location_lot_no_trgm"),
+            trigram_index("road_suffix", "idx_location_road_suffix_trgm"),
+            trigram_index("postcode", "idx_location_postcode_trgm"),
+            models.Index(fields=["address_no"], name="idx_location_address_no"),
+        ]
+
     @classmethod
     def get_headers(cls):
         """Return a list of string values as headers for any list view."""
@@ -1,38 +1,214 @@
 import logging
+from collections import defaultdict
 
+import redis
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 
 from indexer.utils import (
+    COLLECTION_MODELS,
+    bump_search_generation,
+    get_changed_referrals,
+    get_collection_queryset,
+    get_model_collections,
     get_typesense_client,
+    typesense_breaker,
+    typesense_delete_documents,
+    typesense_import_documents,
     typesense_index_condition,
     typesense_index_note,
     typesense_index_record,
     typesense_index_referral,
     typesense_index_task,
+    typesense_unindex_object,
+    typesense_update_referral_context,
 )
-from referral.utils import get_uploaded_file_content
+from referral.utils import EXTRACTED_FILE_TYPES, get_uploaded_file_content
 
 LOGGER = logging.getLogger("prs")
+# Redis set of "<model>:<pk>" keys for objects awaiting indexing.
+INDEX_QUEUE_KEY = "prs:index_queue"
+# Redis key set while a drain of the index queue is scheduled.
+INDEX_QUEUE_SCHEDULED_KEY = "prs:index_queue_scheduled"
+_index_queue = None
+
+
+def get_index_queue() -> redis.Redis:
+    """Return a (lazily-created) Redis client for the index queue. The client connection pool
+    is reset automatically in forked child processes.
+    """
+    global _index_queue
+    if _index_queue is None:
+        _index_queue = redis.Redis.from_url(settings.INDEX_QUEUE_URL)
+    return _index_queue
+
+
+def queue_index_object(pk, model):
+    """Queue a single PRS referral app object to be indexed once the current transaction commits.
+    Repeated saves of an object before the queue is drained are coalesced into a single index update.
+    """
+    transaction.on_commit(lambda: _queue_index_object(pk, model))
+
+
+def _queue_index_object(pk, model):
+    # Called after the transaction commits, so that indexing failure must never raise an exception.
+    try:
+        park_index_object(pk, model)
+    except redis.RedisError:
+        # Fall back to indexing the object immediately.
+        LOGGER.warning(f"Index queue unavailable, indexing {model} {pk} directly")
+        try:
+            if model == "record":
+                index_record.delay(pk=pk)
+            else:
+                index_object.delay(pk=pk, model=model)
+        except Exception:
+            LOGGER.exception(f"Error indexing {model} {pk}")
+    except Exception:
+        LOGGER.exception(f"Error queueing {model} {pk} for indexing")
+
+
+def park_index_object(pk, model, delay=None):
+    """Add a single object to the index queue, and schedule a drain of the queue (unless one is already scheduled).
+    Cached search results for the object's collections are invalidated, as the object has changed in the database
+    (the drain invalidates them again once the object has been indexed).
+    """
+    queue = get_index_queue()
+    queue.sadd(INDEX_QUEUE_KEY, f"{model}:{pk}")
+    try:
+        bump_search_generation(*get_model_collections(model))
+    except Exception:
+        # The cache being unavailable must not prevent the drain being scheduled.
+        LOGGER.exception("Error invalidating cached search results")
+    if delay is None:
+        delay = int(settings.INDEX_QUEUE_DELAY)
+    if queue.set(INDEX_QUEUE_SCHEDULED_KEY, 1, nx=True, ex=delay + 60):
+        drain_index_queue.apply_async(countdown=delay)
+
+
+@shared_task
+def drain_index_queue():
+    """Index all queued objects, using one bulk import request per collection. Queued objects which
+    have since been deleted are removed from the index (including all child documents of a deleted referral).
+    While Typesense is unavailable, objects remain queued until the circuit breaker allows a retry.
+    """
+    queue = get_index_queue()
+    reset = int(settings.TYPESENSE_BREAKER_RESET_SECONDS)
+    if not typesense_breaker.allow():
+        queue.set(INDEX_QUEUE_SCHEDULED_KEY, 1, ex=reset + 60)
+        drain_index_queue.apply_async(countdown=reset)
+        return "Typesense unavailable, index queue parked"
+    # Objects queued from this point onwards will schedule another drain.
+    queue.delete(INDEX_QUEUE_SCHEDULED_KEY)
+
+    queued = defaultdict(set)
+    popped = []
+    while keys := queue.spop(INDEX_QUEUE_KEY, 1000):
+        popped += keys
+        for key in keys:
+            model, pk = key.decode().split(":")
+            queued[model].add(int(pk))
+    if not queued:
+        return "Index queue empty"
+
+    # Records having a new uploaded file require text extraction prior to indexing.
+    if queued["record"]:
+        from referral.models import Record
+
+        extract = Record.objects.filter(
+            pk__in=queued["record"], uploaded_file__isnull=False, uploaded_file_hash__isnull=True, effective_to__isnull=True
+        ).exclude(uploaded_file="")
+        for record in extract:
+            if record.extension in EXTRACTED_FILE_TYPES:
+                queued["record"].discard(record.pk)
+                index_record.delay(pk=record.pk)
+
+    client = get_typesense_client()
+    total = 0
+    try:
+        for collection, (model, get_document) in COLLECTION_MODELS.items():
+            pks = queued.get(model)
+            if not pks:
+                continue
+            field = "record_id" if collection == "record_chunks" else "id"
+            documents = []
+            objects = list(get_collection_queryset(collection).filter(pk__in=pks))
+            indexed = {obj.pk for obj in objects}
+            for obj in objects:
+                document = get_document(obj)
+                documents.extend(document if isinstance(document, list) else [document])
+
+            # Only the Typesense requests are recorded by the circuit breaker, not the database queries and
+            # document building in between them.
+            if collection == "record_chunks" and indexed:
+                # Remove any existing chunks first, as records may now have fewer.
+                with typesense_breaker.call(timed=False):
+                    typesense_delete_documents(collection, [str(pk) for pk in indexed], client, field=field)
+            if model == "referral" and objects:
+                # Find referrals whose fields denormalised into child object documents have changed.
+                with typesense_breaker.call(timed=False):
+                    changed = get_changed_referrals(objects, client)
+            if documents:
+                with typesense_breaker.call(timed=False):
+                    failed_ids = typesense_import_documents(collection, documents, client)
+                if failed_ids:
+                    LOGGER.warning(f"{collection}: failed to index documents {', '.join(failed_ids)}")
+            if model == "referral" and objects:
+                # Update the denormalised referral fields of child object documents.
+                for obj in changed:
+                    with typesense_breaker.call(timed=False):
+                        typesense_update_referral_context(obj, client)
+            # Queued objects that are no longer current have been deleted.
+            deleted = [str(pk) for pk in pks - indexed]
+            if deleted:
+                with typesense_breaker.call(timed=False):
+                    typesense_delete_documents(collection, deleted, client, field=field)
+            if model == "referral" and deleted:
+                for child_collection, (child_model, _) in COLLECTION_MODELS.items():
+                    if child_model != "referral":
+                        with typesense_breaker.call(timed=False):
+                            typesense_delete_documents(child_collection, deleted, client, field="referral_id")
+            total += len(documents)
+    except Exception:
+        # Return all objects to the queue, to be retried.
+        LOGGER.exception("Error draining the index queue, objects have been re-queued")
+        queue.sadd(INDEX_QUEUE_KEY, *popped)
+        queue.set(INDEX_QUEUE_SCHEDULED_KEY, 1, ex=reset + 60)
+        drain_index_queue.apply_async(countdown=reset)
+        raise
+
+    return f"Indexed {total} document(s) in Typesense"
 
 
 @shared_task(default_retry_delay=10, max_retries=1)
-def index_record(pk):
+def index_record(pk, client=None):
+    """Extract the text content of a record's uploaded file (once for each unique file), then index the record."""
     from referral.models import Record
 
     try:
         record = Record.objects.get(pk=pk)
-        if not record.uploaded_file_content:
-            try:
-                record.uploaded_file_content = get_uploaded_file_content(record)
-                # Set index=False to prevent an infinite save loop.
-                record.save(index=False)
-                return f"Indexed record {pk} file content"
-            except:
-                raise
     except Record.DoesNotExist as exc:
         raise index_record.retry(exc=exc)
-    except:
-        raise
+
+    if record.uploaded_file and not record.uploaded_file_hash:
+        record.uploaded_file_hash, record.uploaded_file_content, record.uploaded_file_extraction = get_uploaded_file_content(record)
+        if record.uploaded_file_extraction not in (None, "ok"):
+            LOGGER.warning(f"Record {pk} uploaded file content extraction outcome: {record.uploaded_file_extraction}")
+        if record.uploaded_file_hash:
+            # Set index=False to prevent an infinite save loop.
+            record.save(index=False)
+
+    if not typesense_breaker.allow():
+        # Typesense is unavailable: queue the record for indexing.
+        park_index_object(pk, "record")
+        return f"Queued record {pk} for indexing"
+
+    if not client:
+        client = get_typesense_client()
+    with typesense_breaker.call(timed=False):
+        typesense_index_record(record, client)
+    return f"Indexed record {pk} in Typesense"
 
 
 @shared_task(default_retry_delay=10, max_retries=1)
@@ -98,3 +274,18 @@ def index_object(pk, model, client=None):
             raise
     else:
         return
+
+
+@shared_task(default_retry_delay=10, max_retries=1)
+def unindex_object(pk, model, client=None):
+    """Remove a single deleted PRS referral app object (and for referrals, all child objects) from Typesense."""
+    if not typesense_breaker.allow():
+        # Typesense is unavailable: queue the object, which is removed from the index once the queue is drained.
+        park_index_object(pk, model)
+        return f"Queued {model} {pk} for removal from the index"
+
+    if not client:
+        client = get_typesense_client()
+    with typesense_breaker.call(timed=False):
+        deleted = typesense_unindex_object(model, pk, client)
+    return f"Removed {deleted} document(s) for {model} {pk} from Typesense"
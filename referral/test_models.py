@@ -172,6 +172,18 @@ class ReferralBaseModelTest(PrsTestCase):
         """Test ReferralBaseModel get_absolute_url() method"""
         self.assertTrue(self.obj.get_absolute_url())
 
+    def test_delete_unindex(self):
+        """Test ReferralBaseModel delete() method queues removal from the search index"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.obj.delete()
+        self.assertTrue(self.obj.is_deleted())
+        self.assertEqual(len(callbacks), 1)
+        record = Record.objects.current().first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            record.delete(unindex=False)
+        self.assertTrue(record.is_deleted())
+        self.assertEqual(len(callbacks), 0)
+
 
 class OrganisationTest(PrsTestCase):
     """Unit tests specific to the Organisation model class."""
@@ -488,6 +500,23 @@ class RecordTest(PrsTestCase):
         self.r.save()
         self.assertEqual(self.r.extension, "TXT")
 
+    def test_replaced_file_content(self):
+        """Test that replacing the uploaded file clears its previously-extracted content"""
+        self.r.uploaded_file = self.tmp_f.name
+        self.r.save(index=False)
+        Record.objects.filter(pk=self.r.pk).update(
+            uploaded_file_hash="0" * 64, uploaded_file_content="Content", uploaded_file_extraction="ok"
+        )
+        record = Record.objects.get(pk=self.r.pk)
+        record.save(index=False)
+        self.assertEqual(record.uploaded_file_content, "Content")
+        # Assigning the name of another stored file replaces the uploaded file.
+        record.uploaded_file = "uploads/other.txt"
+        record.save(index=False)
+        self.assertIsNone(record.uploaded_file_content)
+        self.assertIsNone(record.uploaded_file_hash)
+        self.assertIsNone(record.uploaded_file_extraction)
+
     def test_filesize_str(self):
         """Test the Record model filesize_str property."""
         self.assertTrue(hasattr(self.r, "extension"))
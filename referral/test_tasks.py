@@ -0,0 +1,173 @@
+import json
+from collections import defaultdict
+from unittest import mock
+
+from redis import RedisError
+from typesense.exceptions import ServiceUnavailable
+
+from indexer.utils import COLLECTION_MODELS, get_referral_document, typesense_breaker
+from referral.models import Record, Referral, Task
+from referral.tasks import INDEX_QUEUE_KEY, INDEX_QUEUE_SCHEDULED_KEY, drain_index_queue, park_index_object, queue_index_object
+from referral.test_models import PrsTestCase
+
+
+class FakeRedis:
+    """A minimal in-memory stand-in for the Redis commands used by the index queue."""
+
+    def __init__(self):
+        self.sets = defaultdict(set)
+        self.keys = {}
+
+    def sadd(self, key, *values):
+        self.sets[key].update(v.encode() if isinstance(v, str) else v for v in values)
+
+    def spop(self, key, count):
+        return [self.sets[key].pop() for _ in range(min(count, len(self.sets[key])))]
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+
+class IndexQueueTest(PrsTestCase):
+    """Unit tests for queueing objects to be indexed, and draining the index queue."""
+
+    def setUp(self):
+        super().setUp()
+        self.queue = FakeRedis()
+        self.client = mock.MagicMock()
+        self.documents = self.client.collections.__getitem__.return_value.documents
+        self.documents.import_.side_effect = lambda documents, params: [{"success": True} for _ in documents]
+        self.documents.delete.return_value = {"num_deleted": 1}
+        for target, kwargs in (
+            ("referral.tasks.get_index_queue", {"return_value": self.queue}),
+            ("referral.tasks.get_typesense_client", {"return_value": self.client}),
+            ("referral.tasks.drain_index_queue.apply_async", {}),
+        ):
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(typesense_breaker.outcomes.clear)
+        self.addCleanup(setattr, typesense_breaker, "opened_at", None)
+
+    def queued(self):
+        return {key.decode() for key in self.queue.sets[INDEX_QUEUE_KEY]}
+
+    def test_queue_index_object(self):
+        """Test that an object is queued once the transaction commits"""
+        task = Task.objects.current().first()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            queue_index_object(task.pk, "task")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.queued(), {f"task:{task.pk}"})
+
+    def test_queue_index_object_fallback(self):
+        """Test that an object is indexed directly if the index queue is unavailable"""
+        task = Task.objects.current().first()
+        with mock.patch.object(self.queue, "sadd", side_effect=RedisError), mock.patch("referral.tasks.index_object.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_index_object(task.pk, "task")
+        delay.assert_called_once_with(pk=task.pk, model="task")
+
+    def test_queue_index_object_cache_unavailable(self):
+        """Test that an object is still queued, and a drain scheduled, if the cache is unavailable"""
+        task = Task.objects.current().first()
+        with mock.patch("referral.tasks.bump_search_generation", side_effect=ConnectionError):
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_index_object(task.pk, "task")
+        self.assertEqual(self.queued(), {f"task:{task.pk}"})
+        drain_index_queue.apply_async.assert_called_once()
+
+    def test_park_index_object_coalesced(self):
+        """Test that repeated saves of an object are coalesced into one queued item and one drain"""
+        task = Task.objects.current().first()
+        park_index_object(task.pk, "task")
+        park_index_object(task.pk, "task")
+        self.assertEqual(self.queued(), {f"task:{task.pk}"})
+        self.assertIn(INDEX_QUEUE_SCHEDULED_KEY, self.queue.keys)
+        drain_index_queue.apply_async.assert_called_once()
+
+        drain_index_queue()
+        self.documents.import_.assert_called_once()
+        self.assertEqual([doc["id"] for doc in self.documents.import_.call_args.args[0]], [str(task.pk)])
+        self.assertFalse(self.queued())
+        self.assertNotIn(INDEX_QUEUE_SCHEDULED_KEY, self.queue.keys)
+
+    def test_drain_index_queue_empty(self):
+        """Test that draining an empty index queue makes no Typesense requests"""
+        self.assertEqual(drain_index_queue(), "Index queue empty")
+        self.client.collections.__getitem__.assert_not_called()
+
+    def test_drain_index_queue_deleted(self):
+        """Test that queued objects which have been deleted are removed from the index"""
+        task = Task.objects.current().first()
+        task.delete()
+        referral = Referral.objects.current().first()
+        referral.delete()
+        self.queue.sadd(INDEX_QUEUE_KEY, f"task:{task.pk}", f"referral:{referral.pk}")
+        drain_index_queue()
+        self.documents.import_.assert_not_called()
+        filters = [call.args[0]["filter_by"] for call in self.documents.delete.call_args_list]
+        self.assertIn(f"id:[{task.pk}]", filters)
+        self.assertIn(f"id:[{referral.pk}]", filters)
+        # Child object documents of the deleted referral are also removed.
+        self.assertIn(f"referral_id:[{referral.pk}]", filters)
+
+    def test_drain_index_queue_referral_context(self):
+        """Test that child object documents are only updated where the denormalised referral fields have changed"""
+        referral = Referral.objects.current().first()
+        document = get_referral_document(referral)
+        # A new referral has no child documents to update.
+        self.documents.export.return_value = ""
+        self.queue.sadd(INDEX_QUEUE_KEY, f"referral:{referral.pk}")
+        drain_index_queue()
+        self.documents.import_.assert_called_once()
+        self.documents.update.assert_not_called()
+        # An indexed referral having unchanged fields.
+        self.documents.export.return_value = json.dumps(document)
+        self.queue.sadd(INDEX_QUEUE_KEY, f"referral:{referral.pk}")
+        drain_index_queue()
+        self.documents.update.assert_not_called()
+        # An indexed referral having a changed address.
+        self.documents.export.return_value = json.dumps({**document, "address": f"{document['address']} (amended)"})
+        self.queue.sadd(INDEX_QUEUE_KEY, f"referral:{referral.pk}")
+        drain_index_queue()
+        self.assertEqual(self.documents.update.call_count, len(COLLECTION_MODELS) - 1)
+
+    def test_drain_index_queue_extract_record(self):
+        """Test that records having a new uploaded file are handed off for text extraction"""
+        record = Record.objects.current().first()
+        Record.objects.filter(pk=record.pk).update(uploaded_file="uploads/test.pdf", uploaded_file_hash=None)
+        self.queue.sadd(INDEX_QUEUE_KEY, f"record:{record.pk}")
+        with mock.patch("referral.tasks.index_record.delay") as delay:
+            drain_index_queue()
+        delay.assert_called_once_with(pk=record.pk)
+        self.documents.import_.assert_not_called()
+
+    def test_drain_index_queue_requeue(self):
+        """Test that queued objects are returned to the queue if indexing fails"""
+        tasks = list(Task.objects.current())
+        keys = {f"task:{task.pk}" for task in tasks}
+        self.queue.sadd(INDEX_QUEUE_KEY, *keys)
+        self.documents.import_.side_effect = ServiceUnavailable("Service unavailable")
+        with self.assertRaises(ServiceUnavailable):
+            drain_index_queue()
+        self.assertEqual(self.queued(), keys)
+        self.assertIn(INDEX_QUEUE_SCHEDULED_KEY, self.queue.keys)
+        drain_index_queue.apply_async.assert_called_once()
+
+    def test_drain_index_queue_parked(self):
+        """Test that the index queue is left intact while the circuit breaker is open"""
+        task = Task.objects.current().first()
+        self.queue.sadd(INDEX_QUEUE_KEY, f"task:{task.pk}")
+        with mock.patch.object(typesense_breaker, "allow", return_value=False):
+            self.assertEqual(drain_index_queue(), "Typesense unavailable, index queue parked")
+        self.assertEqual(self.queued(), {f"task:{task.pk}"})
+        self.assertIn(INDEX_QUEUE_SCHEDULED_KEY, self.queue.keys)
+        drain_index_queue.apply_async.assert_called_once()
+        self.client.collections.__getitem__.assert_not_called()
@@ -1,20 +1,34 @@
+import os
+import signal
+import subprocess
+import tracemalloc
 from datetime import date, timedelta
 from pathlib import Path
+from tempfile import TemporaryFile
+from unittest import mock
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models.base import ModelBase
 from django.db.models.query import QuerySet
 from django.test import RequestFactory
 from extract_msg import Message
 
+from referral.admin import ReferralAdmin
 from referral.models import Record, Referral, Task
 from referral.test_models import PrsTestCase
 from referral.utils import (
+    ListCountPaginator,
+    SearchResultPaginator,
     breadcrumbs_li,
     dewordify_text,
     filter_queryset,
+    get_query,
+    get_file_content,
+    get_uploaded_file_content,
     is_model_or_string,
     overdue_task_email,
+    read_uploaded_file,
     smart_truncate,
     update_revision_history,
 )
@@ -125,6 +139,18 @@ class UtilsTest(PrsTestCase):
         self.assertTrue(isinstance(ret[0], QuerySet))
         self.assertTrue(isinstance(ret[1], str))
 
+    def test_get_query_model(self):
+        """Test that get_query for a model matches IDs exactly and does not duplicate rows"""
+        ref = Referral.objects.first()
+        ref.tags.add("foobar1", "foobar2")
+        qs = Referral.objects.filter(get_query("foobar", ReferralAdmin.search_fields, Referral))
+        self.assertEqual(list(qs), [ref])
+        # Each search field is tested in its own subquery.
+        self.assertIn("UNION", str(qs.query))
+        qs = Referral.objects.filter(get_query(str(ref.pk), ["id"], Referral))
+        self.assertEqual(list(qs), [ref])
+        self.assertFalse(Referral.objects.filter(get_query("foo", ["id"], Referral)).exists())
+
     def test_dewordify_text(self):
         """Test the dewordify_text utility function"""
         self.assertFalse(dewordify_text(None))
@@ -158,3 +184,102 @@ class UtilsTest(PrsTestCase):
         record.save()
         # Record order_date is no longer empty.
         self.assertTrue(record.order_date)
+
+    def test_uploaded_file_content_reused(self):
+        """Test that text content is extracted once for each unique uploaded file"""
+        path = settings.MEDIA_ROOT + "/test.txt"
+        with open(path, "w") as f:
+            f.write("Proposed clearing of native vegetation")
+        self.addCleanup(os.remove, path)
+        record, duplicate = Record.objects.all()[0:2]
+        record.uploaded_file = path
+        record.save(index=False)
+        digest, content, extraction = get_uploaded_file_content(record)
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(content, "Proposed clearing of native vegetation")
+        self.assertEqual(extraction, "ok")
+        record.uploaded_file_hash = digest
+        record.uploaded_file_content = "Previously extracted content"
+        record.uploaded_file_extraction = "ok"
+        record.save(index=False)
+        # A second record having an identical file reuses the previously-extracted content.
+        duplicate.uploaded_file = path
+        duplicate.save(index=False)
+        self.assertEqual(get_uploaded_file_content(duplicate), (digest, "Previously extracted content", "ok"))
+        # Content of a failed extraction is not reused, so that the extraction is retried.
+        Record.objects.filter(pk=record.pk).update(uploaded_file_content="", uploaded_file_extraction="timeout")
+        self.assertEqual(get_uploaded_file_content(duplicate), (digest, "Proposed clearing of native vegetation", "ok"))
+
+    def test_file_content_extraction_error(self):
+        """Test that an unparseable file records an extraction error outcome"""
+        with TemporaryFile() as f:
+            f.write(b"Not a PDF document")
+            self.assertEqual(get_file_content(f, "PDF"), ("", "error"))
+
+    def test_file_content_extraction_timeout(self):
+        """Test that extraction exceeding the time limit records a timeout outcome"""
+        with self.settings(EXTRACTION_TIMEOUT=0):
+            with TemporaryFile() as f:
+                f.write(b"Text content")
+                self.assertEqual(get_file_content(f, "TXT"), ("", "timeout"))
+
+    def test_file_content_extraction_signal(self):
+        """Test that only signals attributable to the memory limit record an out of memory outcome"""
+        for returncode, outcome in [(-signal.SIGKILL, "oom"), (-signal.SIGSEGV, "oom"), (-signal.SIGTERM, "error")]:
+            result = subprocess.CompletedProcess([], returncode, stdout=b"", stderr=b"")
+            with mock.patch("referral.utils.subprocess.run", return_value=result), TemporaryFile() as f:
+                self.assertEqual(get_file_content(f, "PDF"), ("", outcome))
+
+    def test_read_uploaded_file_memory(self):
+        """Test that reading a large uploaded file streams it to disk, with bounded peak memory use"""
+        path = settings.MEDIA_ROOT + "/test_large.txt"
+        with open(path, "wb") as f:
+            f.write(b"Proposed clearing of native vegetation\n" * 500000)  # ~20 MB
+        self.addCleanup(os.remove, path)
+        record = Record.objects.all()[0]
+        record.uploaded_file = path
+        record.save(index=False)
+        tracemalloc.start()
+        file, digest = read_uploaded_file(record)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        file.close()
+        self.assertEqual(len(digest), 64)
+        # Peak allocation is a small multiple of the storage chunk size, not of the file size.
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+    def test_search_result_paginator(self):
+        """Test the count-only search result paginator"""
+        paginator = SearchResultPaginator(200000, 20)
+        self.assertEqual(paginator.count, 200000)
+        self.assertEqual(paginator.num_pages, 10000)
+        page = paginator.get_page(5)
+        self.assertEqual(page.number, 5)
+        self.assertTrue(page.has_next())
+        self.assertEqual(paginator.get_page(20000).number, 10000)
+
+    def test_list_count_paginator(self):
+        """Test that ListCountPaginator counts the queryset once and caches the count"""
+        count = Referral.objects.count()
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with self.settings(CACHES=locmem):
+            paginator = ListCountPaginator(Referral.objects.all(), 20, cache_key="test_count", cache_seconds=60)
+            with self.assertNumQueries(1):
+                self.assertEqual(paginator.count, count)
+                self.assertEqual(paginator.count, count)
+            self.assertEqual(cache.get("test_count"), count)
+            paginator = ListCountPaginator(Referral.objects.all(), 20, cache_key="test_count", cache_seconds=60)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, count)
+        # The estimate is not used for tables smaller than the threshold.
+        paginator = ListCountPaginator(Referral.objects.all(), 20, estimate_threshold=10**9)
+        self.assertEqual(paginator.count, count)
+        self.assertFalse(paginator.estimated)
+        # Where the estimate is used, a next page is only linked if more rows actually exist.
+        with mock.patch("referral.utils.get_queryset_row_estimate", return_value=1000):
+            paginator = ListCountPaginator(Referral.objects.current(), 20, estimate_threshold=100)
+            self.assertEqual(paginator.count, 1000)
+            self.assertTrue(paginator.estimated)
+            page = paginator.page(1)
+        self.assertEqual(list(page.object_list), list(Referral.objects.current()[:20]))
+        self.assertFalse(page.has_next())
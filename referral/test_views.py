@@ -2,15 +2,19 @@ import json
 import os
 import uuid
 from datetime import date, timedelta
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.contrib.gis.geos import Polygon
+from django.contrib.gis.geos import Point, Polygon
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from mixer.backend.django import mixer
 from taggit.models import Tag
 
+from indexer.utils import bump_search_generation, typesense_breaker
 from referral.models import (
     Bookmark,
     Clearance,
@@ -51,6 +55,13 @@ class PrsViewsTestCase(PrsTestCase):
         # Log in normaluser by default.
         self.client.login(username="normaluser", password="pass")
 
+    def open_typesense_breaker(self):
+        """Open the Typesense circuit breaker (as if Typesense is unavailable) for the duration of a test."""
+        self.addCleanup(typesense_breaker.outcomes.clear)
+        self.addCleanup(setattr, typesense_breaker, "opened_at", None)
+        for _ in range(typesense_breaker.min_calls):
+            typesense_breaker.record(True)
+
 
 class SiteAuthViewsTest(PrsViewsTestCase):
     """Test the site login/login views."""
@@ -180,6 +191,133 @@ class GeneralSearchTest(PrsViewsTestCase):
         self.assertTemplateUsed(resp, "referral/prs_index_search_combined.html")
 
 
+class IndexSearchTest(PrsViewsTestCase):
+    def test_postgres_search(self):
+        """Test that the index search view returns results using the Postgres search engine"""
+        ref = Referral.objects.first()
+        ref.description = "Proposed subdivision of wetland"
+        ref.save()
+        url = reverse("prs_index_search", kwargs={"collection": "referrals"})
+        resp = self.client.get(url, {"q": "wetlands", "engine": "postgres"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["search_engine"], "postgres")
+        self.assertIn(ref, [result["object"] for result in resp.context["search_result"]])
+
+    def test_typesense_breaker_fallback(self):
+        """Test that the index search view falls back to Postgres search while the Typesense circuit breaker is open"""
+        self.open_typesense_breaker()
+        self.assertTrue(typesense_breaker.is_open)
+        url = reverse("prs_index_search", kwargs={"collection": "referrals"})
+        resp = self.client.get(url, {"q": "wetland"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["search_engine"], "postgres")
+
+    def test_search_cache(self):
+        """Test that index search results are cached until the searched collection is updated"""
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        url = reverse("prs_index_search", kwargs={"collection": "referrals"})
+        with self.settings(CACHES=locmem, SEARCH_CACHE_SECONDS=60):
+            resp = self.client.get(url, {"q": "wetland", "engine": "postgres"})
+            self.assertFalse(resp.context["search_cached"])
+            resp = self.client.get(url, {"q": "wetland", "engine": "postgres"})
+            self.assertTrue(resp.context["search_cached"])
+            bump_search_generation("referrals")
+            resp = self.client.get(url, {"q": "wetland", "engine": "postgres"})
+            self.assertFalse(resp.context["search_cached"])
+
+    def test_search_exclude_file_content(self):
+        """Test that record searches don't return (or cache) whole record file content"""
+        client = mock.MagicMock()
+        client.collections.__getitem__.return_value.documents.search.return_value = {"found": 0, "hits": [], "facet_counts": []}
+        url = reverse("prs_index_search", kwargs={"collection": "records"})
+        with mock.patch("referral.views.get_typesense_client", return_value=client):
+            resp = self.client.get(url, {"q": "wetland", "engine": "typesense"})
+        self.assertEqual(resp.status_code, 200)
+        search_q = client.collections.__getitem__.return_value.documents.search.call_args.args[0]
+        self.assertEqual(search_q["exclude_fields"], "file_content")
+
+    def test_facet_filter_json(self):
+        """Test that index search results may be filtered by facet values and returned as JSON"""
+        ref = Referral.objects.first()
+        ref.description = "Proposed subdivision of wetland"
+        ref.save()
+        url = reverse("prs_index_search", kwargs={"collection": "referrals"})
+        resp = self.client.get(url, {"q": "wetland", "engine": "postgres", "type": ref.type.name, "format": "json"})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["filters"], {"type": [ref.type.name]})
+        self.assertIn(ref.pk, [result["id"] for result in data["results"]])
+        resp = self.client.get(url, {"q": "wetland", "engine": "postgres", "type": "foobar", "format": "json"})
+        self.assertEqual(resp.json()["found"], 0)
+
+    def test_combined_search_fallback(self):
+        """Test that the combined search view returns referral details while Typesense is unavailable"""
+        self.open_typesense_breaker()
+        ref = Referral.objects.first()
+        ref.description = "Proposed subdivision of wetland"
+        ref.save()
+        resp = self.client.get(reverse("prs_index_search_combined"), {"q": "wetland"})
+        self.assertEqual(resp.status_code, 200)
+        result = next(result for result in resp.context["search_result"] if result["referral"]["id"] == ref.pk)
+        self.assertEqual(result["referral"]["type"], ref.type.name)
+
+    def test_unknown_collection(self):
+        """Test that the index search view returns 404 for an unknown collection"""
+        url = reverse("prs_index_search", kwargs={"collection": "foo"})
+        resp = self.client.get(url, {"q": "wetland"})
+        self.assertEqual(resp.status_code, 404)
+
+
+class ReferralSuggestTest(PrsViewsTestCase):
+    def test_suggest_fallback(self):
+        """Test that the referral typeahead endpoint returns prefix matches while Typesense is unavailable"""
+        self.open_typesense_breaker()
+        ref = Referral.objects.first()
+        ref.reference = "PA-123456"
+        ref.save()
+        url = reverse("referral_suggest")
+        resp = self.client.get(url, {"q": "pa-1234"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(ref.pk, [result["id"] for result in resp.json()["results"]])
+        # Queries shorter than two characters return no results.
+        resp = self.client.get(url, {"q": "p"})
+        self.assertEqual(resp.json()["found"], 0)
+
+
+class ReferralGeoSearchTest(PrsViewsTestCase):
+    def test_geo_search_fallback(self):
+        """Test that the referral geo search endpoint returns nearby referrals while Typesense is unavailable"""
+        self.open_typesense_breaker()
+        ref = Referral.objects.first()
+        Referral.objects.filter(pk=ref.pk).update(point=Point(115.86, -31.95, srid=4283))
+        url = reverse("referral_geo_search")
+        resp = self.client.get(url, {"lat": -31.95, "lng": 115.85, "radius": 5})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(ref.pk, [result["id"] for result in resp.json()["results"]])
+        resp = self.client.get(url, {"bbox": "115.8,-32.0,115.9,-31.9"})
+        self.assertIn(ref.pk, [result["id"] for result in resp.json()["results"]])
+        resp = self.client.get(url, {"lat": "foo", "lng": 115.85})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_geo_search_invalid(self):
+        """Test that the referral geo search endpoint rejects out-of-range or non-finite coordinates"""
+        url = reverse("referral_geo_search")
+        for params in [
+            {"lat": "nan", "lng": 115.85},
+            {"lat": -31.95, "lng": "inf"},
+            {"lat": -91, "lng": 115.85},
+            {"lat": -31.95, "lng": 181},
+            {"lat": -31.95, "lng": 115.85, "radius": 0},
+            {"lat": -31.95, "lng": 115.85, "radius": "inf"},
+            {"bbox": "115.9,-32.0,115.8,-31.9"},
+            {"bbox": "115.8,-31.9,115.9,-32.0"},
+            {"bbox": "115.8,-32.0,nan,-31.9"},
+            {"bbox": "115.8,-32.0,115.9"},
+        ]:
+            resp = self.client.get(url, params)
+            self.assertEqual(resp.status_code, 400, params)
+
+
 class ReferralDetailTest(PrsViewsTestCase):
     """Test the referral detail view."""
 
@@ -248,6 +386,63 @@ class ReferralDetailTest(PrsViewsTestCase):
         resp = self.client.get(url)
         self.assertContains(resp, "Remove bookmark")
 
+    def test_query_count(self):
+        """Test that the number of queries to render the referral details page does not increase with child objects"""
+        url = self.ref.get_absolute_url()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        # Add additional child objects of each type to the referral.
+        mixer.cycle(3).blend(
+            Task, type=mixer.SELECT, referral=self.ref, state=mixer.SELECT, assigned_user=self.n_user, search_vector=None
+        )
+        mixer.cycle(3).blend(Note, referral=self.ref, type=mixer.SELECT, note=mixer.RANDOM, search_vector=None)
+        mixer.cycle(3).blend(Record, referral=self.ref, search_vector=None)
+        mixer.cycle(3).blend(Location, referral=self.ref)
+        mixer.cycle(3).blend(
+            Condition, referral=self.ref, category=mixer.SELECT, condition=mixer.RANDOM, model_condition=mixer.SELECT, search_vector=None
+        )
+        with self.assertNumQueries(len(queries)):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["task_count"], self.ref.task_set.current().count())
+
+
+class ReferralDetailTabTest(PrsViewsTestCase):
+    """Test the referral detail child object tab view."""
+
+    def setUp(self):
+        super().setUp()
+        self.ref = Task.objects.first().referral
+
+    def test_get(self):
+        """Test that each of the referral child object tabs render"""
+        for m in ["tasks", "notes", "records", "locations", "conditions"]:
+            url = reverse("referral_detail_tab", kwargs={"pk": self.ref.pk, "related_model": m})
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.has_header("ETag"))
+        url = reverse("referral_detail_tab", kwargs={"pk": self.ref.pk, "related_model": "foo"})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_not_modified(self):
+        """Test that an unchanged tab returns a 304 response, and a modified tab is rendered again"""
+        url = reverse("referral_detail_tab", kwargs={"pk": self.ref.pk, "related_model": "tasks"})
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            resp = self.client.get(url)
+            self.assertContains(resp, "prs-object-table")
+            etag = resp["ETag"]
+            resp = self.client.get(url, headers={"if-none-match": etag})
+            self.assertEqual(resp.status_code, 304)
+            task = self.ref.task_set.current().first()
+            task.description = "Updated task description"
+            task.save()
+            resp = self.client.get(url, headers={"if-none-match": etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertContains(resp, "Updated task description")
+
 
 class ReferralCreateTest(PrsViewsTestCase):
     """Test the customised referral create view."""
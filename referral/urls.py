@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from referral import views
@@ -11,6 +12,8 @@ urlpatterns = [
     path("referrals/tagged/<str:slug>/", views.ReferralTagged.as_view(), name="referral_tagged"),
     path("referrals/reference-search/", views.ReferralReferenceSearch.as_view(), name="referral_reference_search"),
     path("referrals/point-search/", views.ReferralPointSearch.as_view(), name="referral_point_search"),
+    path("referrals/suggest/", views.ReferralSuggest.as_view(), name="referral_suggest"),
+    path("referrals/geo-search/", views.ReferralGeoSearch.as_view(), name="referral_geo_search"),
     path("referrals/<int:pk>/", views.ReferralDetail.as_view(), name="referral_detail"),
     path("referrals/<int:pk>/relate/", views.ReferralRelate.as_view(), name="referral_relate"),
     path("referrals/<int:pk>/history/", PrsObjectHistory.as_view(model=Referral), name="prs_object_history"),
@@ -20,6 +23,7 @@ urlpatterns = [
     path("referrals/<int:pk>/locations/create/", views.LocationCreate.as_view(), name="referral_location_create"),
     path("referrals/<int:pk>/locations/download/", views.ReferralLocationDownload.as_view(), name="referral_location_download"),
     path("referrals/<int:pk>/tag/", PrsObjectTag.as_view(model=Referral), name="referral_tag"),
+    path("referrals/<int:pk>/tab/<str:related_model>/", views.ReferralDetailTab.as_view(), name="referral_detail_tab"),
     path("referrals/<int:pk>/<str:related_model>/", views.ReferralDetail.as_view(), name="referral_detail"),
     path("referrals/<int:pk>/<str:model>/create/", views.ReferralCreateChild.as_view(), name="referral_create_child"),
     # The following URL allows us to specify the 'type' of child object created (e.g. a clearance request Task)
@@ -56,7 +60,14 @@ urlpatterns += [
     path("print/", views.SiteHome.as_view(printable=True), name="site_home_print"),
     path("cadastre-query/", views.CadastreQuery.as_view(), name="cadastre_query"),
     path("geocode/", views.GeocodeQuery.as_view(), name="geocode_query"),
-    path("<str:model>/", views.PrsObjectList.as_view(), name="prs_object_list"),
+    path(
+        "<str:model>/",
+        views.PrsObjectList.as_view(
+            count_cache_seconds=settings.LIST_COUNT_CACHE_SECONDS,
+            count_estimate_threshold=settings.LIST_COUNT_ESTIMATE_THRESHOLD,
+        ),
+        name="prs_object_list",
+    ),
     path("<str:model>/create/", views.PrsObjectCreate.as_view(), name="prs_object_create"),
     path("<str:model>/<int:pk>/", views.PrsObjectDetail.as_view(), name="prs_object_detail"),
     path("<str:model>/<int:pk>/update/", views.PrsObjectUpdate.as_view(), name="prs_object_update"),
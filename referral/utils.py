@@ -1,35 +1,42 @@
 import json
 import logging
 import re
+import resource
+import signal
+import subprocess
+import sys
 from datetime import date
-from io import BytesIO
+from hashlib import sha256
 from string import punctuation
-from typing import Any
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any
 
-import docx2txt
 import pyproj
 import requests
 from dbca_utils.utils import env
 from django.apps import apps
 from django.conf import settings
 from django.contrib import admin
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
-from django.db.models import Q
+from django.core.paginator import Page, Paginator
+from django.db.models import IntegerField, Q, QuerySet
 from django.db.models.base import ModelBase
 from django.http import HttpRequest
 from django.utils.encoding import smart_str
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
-from extract_msg import Message
 from fiona.io import ZipMemoryFile
 from fudgeo.constant import WGS84
 from fudgeo.geopkg import SpatialReferenceSystem
-from pdfminer import high_level
 from reversion.models import Version
 from shapely import force_2d
 from shapely.geometry import shape
 from shapely.ops import transform
 from unidecode import unidecode
 
+from referral.extract import EXIT_OOM
+
 LOGGER = logging.getLogger("prs")
 
 
@@ -122,25 +129,58 @@ def breadcrumbs_li(links: list[tuple[str, str]]) -> str:
     return crumbs
 
 
-def get_query(query_string: str, search_fields: list[str]) -> Q | None:
+def is_numeric_lookup(model: ModelBase, field_path: str) -> bool:
+    """Returns True if the lookup path for the model ends in an integer field (e.g. id, referral__id)."""
+    opts = model._meta
+    names = field_path.split("__")
+    for name in names[:-1]:
+        opts = opts.get_field(name).related_model._meta
+    return isinstance(opts.get_field(names[-1]), IntegerField)
+
+
+def get_query(query_string: str, search_fields: list[str], model: ModelBase | None = None) -> Q | None:
     """Returns a query which is a combination of Q objects. That combination
     aims to search keywords within a model by testing the given search fields.
 
     Splits the query string into individual keywords, getting rid of unecessary
     spaces and grouping quoted words together.
+
+    If the model is passed in, each keyword is tested as a UNION of single-field queries
+    (pk__in), so that every field is searched using its own index: the trigram indexes on
+    local columns, or the foreign key index for fields on related models (e.g. type__name).
+    An OR across local and joined columns cannot use those indexes. The UNION also removes
+    duplicate rows for multi-valued relationships (e.g. tags__name), so the queryset does
+    not need to be made distinct. Integer fields (e.g. IDs) are matched exactly, for numeric
+    terms only.
     """
     findterms = re.compile(r'"([^"]+)"|(\S+)').findall
     normspace = re.compile(r"\s{2,}").sub
     query = None  # Query to search for every search term
     terms = [normspace(" ", (t[0] or t[1]).strip()) for t in findterms(query_string)]
     for term in terms:
-        or_query = None  # Query to search for a given term in each field
-        for field_name in search_fields:
-            q = Q(**{"%s__icontains" % field_name: term})
-            if or_query is None:
-                or_query = q
+        if model is None:
+            or_query = None  # Query to search for a given term in each field
+            for field_name in search_fields:
+                q = Q(**{"%s__icontains" % field_name: term})
+                if or_query is None:
+                    or_query = q
+                else:
+                    or_query = or_query | q
+        else:
+            field_queries = []  # Query of matching PKs for a given term in each field
+            for field_name in search_fields:
+                if is_numeric_lookup(model, field_name):
+                    if not term.isdecimal():
+                        continue
+                    lookup = {field_name: int(term)}
+                else:
+                    lookup = {"%s__icontains" % field_name: term}
+                field_queries.append(model._default_manager.filter(**lookup).values("pk").order_by())
+            if field_queries:
+                or_query = Q(pk__in=field_queries[0].union(*field_queries[1:]))
             else:
-                or_query = or_query | q
+                # The term cannot match any field (e.g. a non-numeric term when only ID fields are searched).
+                or_query = Q(pk__in=[])
         if query is None:
             query = or_query
         else:
@@ -167,7 +207,7 @@ def filter_queryset(request: HttpRequest, model: ModelBase, queryset: Any) -> tu
     search_string = search_string.replace("'", r'"')
     if admin.site._registry[model].search_fields:
         search_fields = admin.site._registry[model].search_fields
-        entry_query = get_query(search_string, search_fields)
+        entry_query = get_query(search_string, search_fields, model)
         queryset = queryset.filter(entry_query)
     return queryset, search_string
 
@@ -313,6 +353,82 @@ def query_geocoder(q: str) -> list[dict[str, Any]]:
     return response
 
 
+class SearchResultPaginator(Paginator):
+    """Paginator for externally-paginated search results, where only the total hit count is known.
+    Pages are empty: the current page of results is returned by the search engine.
+    """
+
+    def __init__(self, count: int, per_page: int, **kwargs):
+        super().__init__([], per_page, **kwargs)
+        self._count = count
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+
+def get_queryset_row_estimate(queryset: QuerySet) -> int:
+    """Returns the query planner's estimate of the number of rows returned by the queryset (from EXPLAIN).
+    Unlike the table size (pg_class.reltuples), the estimate accounts for the queryset filters, e.g. the
+    exclusion of soft-deleted objects by current().
+    """
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan["Plan"]["Plan Rows"])
+
+
+class EstimatedPage(Page):
+    """Page of a paginator having an estimated count, which knows whether a next page actually exists."""
+
+    def __init__(self, object_list, number, paginator, next_exists):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = next_exists
+
+    def has_next(self):
+        return self.next_exists
+
+
+class ListCountPaginator(Paginator):
+    """Paginator for object list views which avoids counting large querysets where possible.
+    If `estimate_threshold` is supplied and the queryset is estimated to return more rows than that,
+    the estimate is used as the count (and `estimated` is set). Otherwise, if `cache_key` is
+    supplied, the count is cached for `cache_seconds`.
+    """
+
+    def __init__(self, object_list, per_page, cache_key=None, cache_seconds=0, estimate_threshold=0, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.cache_seconds = cache_seconds
+        self.estimate_threshold = estimate_threshold
+        self.estimated = False
+
+    @cached_property
+    def count(self) -> int:
+        if self.estimate_threshold:
+            estimate = get_queryset_row_estimate(self.object_list)
+            if estimate > self.estimate_threshold:
+                self.estimated = True
+                return estimate
+        if not self.cache_key or not self.cache_seconds:
+            return super().count
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.cache_key, count, self.cache_seconds)
+        return count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        # The estimated count may differ from the actual number of rows, so fetch one extra row
+        # to find out whether a next page exists.
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom : bottom + self.per_page + 1])
+        return EstimatedPage(object_list[: self.per_page], number, self, len(object_list) > self.per_page)
+
+
 def get_previous_pages(page_num: Any, count: int = 5) -> list[int]:
     """Convenience function to take a Paginator page object and return the previous `count`
     page numbers, to a minimum of 1.
@@ -342,75 +458,104 @@ def get_next_pages(page_num: Any, count: int = 5) -> list[int]:
     return next_page_numbers
 
 
-def get_uploaded_file_content(record: Any) -> str | None:
-    """Convenience function that takes in a Record object and returns the uploaded file's text content (for a given set of file types)."""
-    if not record.pk or not record.extension or record.extension not in ["PDF", "MSG", "DOCX", "TXT"]:
-        return None
+# Uploaded file types from which text content is extracted.
+EXTRACTED_FILE_TYPES = ["PDF", "MSG", "DOCX", "TXT"]
+# Uploaded files larger than this (in bytes) are spooled to disk rather than held in memory.
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024
 
-    file_content = ""
 
-    # PDF document content.
-    if record.extension == "PDF":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                with open(record.uploaded_file.path, "rb") as f:
-                    file_content = high_level.extract_text(f)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(record.uploaded_file.read())
-                file_content = high_level.extract_text(tmp)
-        except:
-            pass
+def read_uploaded_file(record: Any) -> tuple[SpooledTemporaryFile, str]:
+    """Stream a record's uploaded file from the configured storage into a temporary file in chunks, and return
+    the temporary file together with the file's SHA-256 hex digest. Peak memory use is bounded by the chunk
+    and spool sizes, regardless of the uploaded file size. The caller is responsible for closing the file.
+    """
+    tmp = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+    digest = sha256()
+    try:
+        with record.uploaded_file.open("rb") as f:
+            for chunk in f.chunks():
+                digest.update(chunk)
+                tmp.write(chunk)
+    except:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    return tmp, digest.hexdigest()
 
-    # MSG document content.
-    if record.extension == "MSG":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                message = Message(record.uploaded_file.path)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(record.uploaded_file.read())
-                message = Message(tmp)
-            file_content = f"{message.subject} {message.body}"
-        except UnicodeDecodeError:
-            LOGGER.warning(f"Record {record.pk} content raised UnicodeDecodeError")
-        except:
-            pass
 
-    # DOCX document content.
-    if record.extension == "DOCX":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                file_content = docx2txt.process(record.uploaded_file.path)
-            else:
-                # Read the upload blob content into an in-memory file.
-                tmp = BytesIO()
-                tmp.write(record.uploaded_file.read())
-                file_content = docx2txt.process(tmp)
-        except:
-            pass
+def get_file_content(file: IO[bytes], extension: str) -> tuple[str, str]:
+    """Convenience function that takes in a file object and extension, and returns a tuple of the file's
+    text content (for a given set of file types) and the extraction outcome (ok/timeout/oom/error).
+    Text is extracted in a separate child process, subject to configured time, memory and page limits.
+    The file is passed to the child process as its (seekable) stdin, so it is never copied in memory.
+    """
 
-    # TXT document content.
-    if record.extension == "TXT":
-        try:
-            if settings.LOCAL_MEDIA_STORAGE:
-                with open(record.uploaded_file.path, "r") as f:
-                    file_content = f.read()
-            else:
-                # Read the upload blob content directly.
-                file_content = record.uploaded_file.read()
-        except:
-            pass
+    def set_memory_limit():
+        limit = int(settings.EXTRACTION_MEMORY_LIMIT) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    # Calling fileno() on a SpooledTemporaryFile rolls it over to disk, if required.
+    stdin = file.fileno()
+    file.seek(0)
 
-    # Decode any bytes object to a string and remove leading/trailing whitespace.
-    if isinstance(file_content, bytes):
-        file_content = file_content.decode("utf-8", errors="ignore").strip()
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "referral.extract", extension, str(settings.EXTRACTION_PAGE_LIMIT)],
+            stdin=stdin,
+            capture_output=True,
+            cwd=settings.BASE_DIR,
+            timeout=int(settings.EXTRACTION_TIMEOUT),
+            preexec_fn=set_memory_limit,
+        )
+    except subprocess.TimeoutExpired:
+        return "", "timeout"
+
+    if result.returncode == 0:
+        return result.stdout.decode("utf-8", errors="ignore"), "ok"
+    if result.returncode == EXIT_OOM:
+        return "", "oom"
+    if result.returncode < 0:
+        sig = -result.returncode
+        # A failed allocation in a parser's C code (under the address space limit) may crash the child
+        # process, and the kernel OOM killer sends SIGKILL. Other signals are recorded as errors.
+        if sig in (signal.SIGKILL, signal.SIGSEGV):
+            LOGGER.warning(f"{extension} file content extraction killed by signal {sig} ({signal.strsignal(sig)}), assumed out of memory")
+            return "", "oom"
+        LOGGER.warning(f"{extension} file content extraction killed by signal {sig} ({signal.strsignal(sig)})")
+        return "", "error"
+    LOGGER.warning(f"{extension} file content extraction failed: {result.stderr.decode('utf-8', errors='ignore')}")
+    return "", "error"
+
+
+def get_uploaded_file_content(record: Any) -> tuple[str | None, str | None, str | None]:
+    """Convenience function that takes in a Record object and returns a tuple of the SHA-256 hex digest
+    of the uploaded file, the file's text content (for a given set of file types) and the extraction outcome.
+    Text is only extracted once for each unique file: if another record has an uploaded file having the
+    same digest, its previously (and successfully) extracted content is reused instead.
+    """
+    from .models import Record
 
-    # Remove any NUL (0x00) or form feed (0x0c) characters.
-    file_content = file_content.replace("\x00", "").replace("\x0c", "")
-    return file_content
+    if not record.pk or not record.extension or record.extension not in EXTRACTED_FILE_TYPES:
+        return None, None, None
+
+    try:
+        file, digest = read_uploaded_file(record)
+    except Exception:
+        LOGGER.warning(f"Record {record.pk} uploaded file could not be read")
+        return None, None, None
+
+    with file:
+        # Content extracted prior to recording the file digest belongs to the current uploaded file.
+        if record.uploaded_file_content is not None and not record.uploaded_file_hash:
+            return digest, record.uploaded_file_content, "ok"
+
+        # Only reuse successfully-extracted content, so that failed extractions (e.g. a timeout) are retried.
+        existing = Record.objects.filter(uploaded_file_hash=digest, uploaded_file_extraction="ok").exclude(pk=record.pk)
+        existing = existing.values_list("uploaded_file_content", "uploaded_file_extraction").first()
+        if existing:
+            return digest, *existing
+
+        return digest, *get_file_content(file, record.extension)
 
 
 STOP_WORDS = [
@@ -1,27 +1,36 @@
 import json
+import logging
 import re
 from copy import copy
 from datetime import date, datetime, timedelta
+from time import perf_counter
+from urllib.parse import urlencode
 
 from dbca_utils.utils import env
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import Group
-from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Point
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Point, Polygon
+from django.contrib.gis.measure import D
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
-from django.core.paginator import Paginator
 from django.core.serializers import serialize
-from django.db.models import F, Q
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.utils.safestring import mark_safe
 from django.views.generic import FormView, ListView, TemplateView, View
 from extract_msg import Message
 from taggit.models import Tag
 
-from indexer.utils import get_typesense_client
+from indexer.search import SEARCH_CONFIG, get_facet_fields, get_facet_filter_by, get_facet_filter_q, postgres_search
+from indexer.utils import collapse_grouped_hits, get_search_cache_key, get_typesense_client, typesense_breaker
 from referral.forms import (
     ClearanceCreateForm,
     IntersectingReferralForm,
@@ -55,7 +64,10 @@ from referral.models import (
     TaskType,
 )
 from referral.utils import (
+    SearchResultPaginator,
     breadcrumbs_li,
+    get_next_pages,
+    get_previous_pages,
     is_model_or_string,
     is_prs_power_user,
     parse_shapefile,
@@ -66,6 +78,8 @@ from referral.utils import (
 )
 from referral.views_base import PrsObjectCreate, PrsObjectDelete, PrsObjectDetail, PrsObjectList, PrsObjectUpdate
 
+LOGGER = logging.getLogger("prs")
+
 
 class SiteHome(LoginRequiredMixin, ListView):
     """Site home page view. Returns an object list of tasks (ongoing or stopped)."""
@@ -119,6 +133,14 @@ class HelpPage(LoginRequiredMixin, TemplateView):
 
 class IndexSearch(LoginRequiredMixin, TemplateView):
     template_name = "referral/prs_index_search.html"
+    # Collection name: (model, Typesense query_by fields, related fields used by the model as_row() method).
+    SEARCH_COLLECTIONS = {
+        "referrals": (Referral, "reference,description,address,type,referring_org,lga", ("type", "referring_org")),
+        "records": (Record, "name,description,file_name,file_content", ("referral",)),
+        "notes": (Note, "note", ("type", "creator", "referral")),
+        "tasks": (Task, "description,assigned_user", ("type", "state", "assigned_user", "referral")),
+        "conditions": (Condition, "proposed_condition,approved_condition", ("category", "referral")),
+    }
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -127,6 +149,8 @@ class IndexSearch(LoginRequiredMixin, TemplateView):
             collection = kwargs["collection"]
         else:
             collection = "referrals"
+        if collection not in self.SEARCH_COLLECTIONS:
+            raise Http404
 
         context["page_title"] = " | ".join([settings.APPLICATION_ACRONYM, f"Search {collection}"])
         context["page_heading"] = f"SEARCH {collection}".upper()
@@ -137,101 +161,160 @@ class IndexSearch(LoginRequiredMixin, TemplateView):
         if self.request.GET.get("q"):
             context["query_string"] = self.request.GET["q"]
             context["search_result"] = []
-            client = get_typesense_client()
-            page = self.request.GET.get("page", 1)
+            try:
+                page = max(int(self.request.GET.get("page", 1)), 1)
+            except ValueError:
+                page = 1
+            model, query_by, related = self.SEARCH_COLLECTIONS[collection]
+            context["result_headers"] = model.get_headers()
+
+            # The search engine may be overridden per request (e.g. to compare engines).
+            engine = self.request.GET.get("engine", settings.SEARCH_ENGINE)
+            if engine not in ("typesense", "postgres"):
+                engine = settings.SEARCH_ENGINE
+            chunks = collection == "records" and settings.TYPESENSE_RECORD_CHUNKS
             search_q = {
                 "q": self.request.GET["q"],
+                "query_by": query_by,
                 "sort_by": "created:desc",
                 "num_typos": 0,
                 "page": page,
                 "per_page": 20,
             }
-
-            if collection == "referrals":
-                context["result_headers"] = Referral.get_headers()
-                search_q["query_by"] = "reference,description,address,type,referring_org,lga"
-            elif collection == "records":
-                context["result_headers"] = Record.get_headers()
-                search_q["query_by"] = "name,description,file_name,file_content"
-            elif collection == "notes":
-                context["result_headers"] = Note.get_headers()
-                search_q["query_by"] = "note"
-            elif collection == "tasks":
-                context["result_headers"] = Task.get_headers()
-                search_q["query_by"] = "description,assigned_user"
-            elif collection == "conditions":
-                context["result_headers"] = Condition.get_headers()
-                search_q["query_by"] = "proposed_condition,approved_condition"
-
-            search_result = client.collections[collection].documents.search(search_q)
+            # Facet counts and filters, using the facet fields of the collection schema
+            # (not available when searching record content chunks).
+            facet_fields = [] if chunks else get_facet_fields(collection)
+            filters = {field: values for field in facet_fields if (values := [v for v in self.request.GET.getlist(field) if v])}
+            if facet_fields:
+                search_q["facet_by"] = ",".join(facet_fields)
+                search_q["max_facet_values"] = 20
+            if filters:
+                search_q["filter_by"] = get_facet_filter_by(filters)
+            if collection == "records":
+                # Record file content is only displayed as highlighted snippets: don't return (or cache) whole documents.
+                search_q["exclude_fields"] = "file_content"
+            # Results are cached for the requested engine (results of a fallback to Postgres search are not cached).
+            cache_key = get_search_cache_key(
+                ["record_chunks" if chunks else collection], {**search_q, "collection": collection, "engine": engine}
+            )
+            start = perf_counter()
+            search_result = cache.get(cache_key) if settings.SEARCH_CACHE_SECONDS else None
+            context["search_cached"] = search_result is not None
+
+            if search_result is None:
+                requested_engine = engine
+                # Fail fast to Postgres search while Typesense is unavailable.
+                if engine == "typesense" and not typesense_breaker.allow():
+                    engine = "postgres"
+
+                if engine == "typesense":
+                    client = get_typesense_client()
+                    if chunks:
+                        # Search record content chunks, returning the best-matching chunk for each record.
+                        search_q["group_by"] = "record_id"
+                        search_q["group_limit"] = 1
+
+                    try:
+                        with typesense_breaker.call():
+                            if chunks:
+                                search_result = client.collections["record_chunks"].documents.search(search_q)
+                                search_result["hits"] = collapse_grouped_hits(search_result)
+                            else:
+                                search_result = client.collections[collection].documents.search(search_q)
+                    except Exception:
+                        LOGGER.exception("Typesense search failed, falling back to Postgres search")
+                        engine = "postgres"
+
+                if engine == "postgres":
+                    search_result = postgres_search(collection, self.request.GET["q"], page, 20, filters)
+
+                if engine == requested_engine and settings.SEARCH_CACHE_SECONDS:
+                    search_result = {key: search_result[key] for key in ("found", "hits", "facet_counts") if key in search_result}
+                    cache.set(cache_key, search_result, settings.SEARCH_CACHE_SECONDS)
+
+            context["search_engine"] = engine
+            context["search_time_ms"] = round((perf_counter() - start) * 1000)
             context["search_result_count"] = search_result["found"]
-            paginator = Paginator(tuple(_ for _ in range(search_result["found"])), 20)
+            paginator = SearchResultPaginator(search_result["found"], 20)
             context["page_obj"] = paginator.get_page(page)
+            context["previous_pages"] = get_previous_pages(context["page_obj"])
+            context["next_pages"] = get_next_pages(context["page_obj"])
+            context["facets"] = self.get_facets(search_result.get("facet_counts", []), filters)
+            context["facet_filters"] = filters
+            # Facet filters are retained by pagination links.
+            context["filter_params"] = urlencode(filters, doseq=True)
 
-            if collection == "referrals":
-                for hit in search_result["hits"]:
-                    highlights = []
-                    for key, value in hit["highlight"].items():
-                        # Replace underscores in search field names with spaces.
-                        highlights.append((key.replace("_", " "), value["snippet"]))
-                    hit["highlights"] = highlights
-                    context["search_result"].append(
-                        {
-                            "object": Referral.objects.get(pk=hit["document"]["id"]),
-                            "highlights": highlights,
-                        }
-                    )
-            elif collection == "records":
-                for hit in search_result["hits"]:
-                    highlights = []
-                    for key, value in hit["highlight"].items():
-                        highlights.append((key.replace("_", " "), value["snippet"]))
-                    hit["highlights"] = highlights
-                    context["search_result"].append(
-                        {
-                            "object": Record.objects.get(pk=hit["document"]["id"]),
-                            "highlights": highlights,
-                        }
-                    )
-            elif collection == "notes":
-                for hit in search_result["hits"]:
-                    highlights = []
-                    for key, value in hit["highlight"].items():
-                        highlights.append((key.replace("_", " "), value["snippet"]))
-                    hit["highlights"] = highlights
-                    context["search_result"].append(
-                        {
-                            "object": Note.objects.get(pk=hit["document"]["id"]),
-                            "highlights": highlights,
-                        }
-                    )
-            elif collection == "tasks":
-                for hit in search_result["hits"]:
-                    highlights = []
-                    for key, value in hit["highlight"].items():
-                        highlights.append((key.replace("_", " "), value["snippet"]))
-                    hit["highlights"] = highlights
-                    context["search_result"].append(
-                        {
-                            "object": Task.objects.get(pk=hit["document"]["id"]),
-                            "highlights": highlights,
-                        }
-                    )
-            elif collection == "conditions":
-                for hit in search_result["hits"]:
-                    highlights = []
-                    for key, value in hit["highlight"].items():
-                        highlights.append((key.replace("_", " "), value["snippet"]))
-                    hit["highlights"] = highlights
-                    context["search_result"].append(
-                        {
-                            "object": Condition.objects.get(pk=hit["document"]["id"]),
-                            "highlights": highlights,
-                        }
-                    )
+            # Query all objects in the page of results at once.
+            objects = model.objects.select_related(*related).in_bulk([int(hit["document"]["id"]) for hit in search_result["hits"]])
+
+            for hit in search_result["hits"]:
+                obj = objects.get(int(hit["document"]["id"]))
+                if not obj:
+                    continue
+                highlights = []
+                for key, value in hit["highlight"].items():
+                    # Chunk documents include the page number of the matched content.
+                    if key == "file_content" and "page" in hit["document"]:
+                        key = f"file_content_(page_{hit['document']['page']})"
+                    # Replace underscores in search field names with spaces.
+                    highlights.append((key.replace("_", " "), value["snippet"]))
+                context["search_result"].append({"object": obj, "highlights": highlights})
 
         return context
 
+    def get_facets(self, facet_counts, filters):
+        """Return the facet counts of a search result for display, with a link to toggle filtering by each value."""
+        facets = []
+        for facet in facet_counts:
+            field = facet["field_name"]
+            selected = filters.get(field, [])
+            values = []
+            for count in facet["counts"]:
+                params = self.request.GET.copy()
+                params.pop("page", None)
+                if count["value"] in selected:
+                    params.setlist(field, [value for value in selected if value != count["value"]])
+                else:
+                    params.setlist(field, selected + [count["value"]])
+                values.append(
+                    {
+                        "value": count["value"],
+                        "count": count["count"],
+                        "selected": count["value"] in selected,
+                        "url": f"?{params.urlencode()}",
+                    }
+                )
+            facets.append({"field": field, "label": field.replace("_", " "), "values": values})
+        return facets
+
+    def render_to_response(self, context, **response_kwargs):
+        """Return the search results and facet counts as JSON, if requested."""
+        if self.request.GET.get("format") != "json":
+            return super().render_to_response(context, **response_kwargs)
+        if "search_result" not in context:
+            return JsonResponse({"found": 0, "results": [], "facets": []})
+        return JsonResponse(
+            {
+                "found": context["search_result_count"],
+                "page": context["page_obj"].number,
+                "num_pages": context["page_obj"].paginator.num_pages,
+                "engine": context["search_engine"],
+                "filters": context["facet_filters"],
+                "facets": [
+                    {"field": facet["field"], "counts": [{"value": v["value"], "count": v["count"]} for v in facet["values"]]}
+                    for facet in context["facets"]
+                ],
+                "results": [
+                    {
+                        "id": result["object"].pk,
+                        "url": result["object"].get_absolute_url(),
+                        "highlights": dict(result["highlights"]),
+                    }
+                    for result in context["search_result"]
+                ],
+            }
+        )
+
 
 class IndexSearchCombined(LoginRequiredMixin, TemplateView):
     """A combined version of the index search which returns referrals with linked objects."""
@@ -250,20 +333,92 @@ class IndexSearchCombined(LoginRequiredMixin, TemplateView):
         if self.request.GET.get("q"):
             context["query_string"] = self.request.GET["q"]
             context["search_result"] = []
-            context["referral_headers"] = Referral.get_headers()
+            context["referral_headers"] = ["Referral ID", "Reference", "Type", "Region(s)", "Address"]
             client = get_typesense_client()
             search_q = {
                 "q": self.request.GET["q"],
                 "sort_by": "created:desc",
                 "num_typos": 0,
             }
+            searches = [
+                {"collection": "referrals", "query_by": "reference,description,address,type,referring_org,lga"},
+                {"collection": "records", "query_by": "name,description,file_name,file_content", "exclude_fields": "file_content"},
+                {"collection": "notes", "query_by": "note"},
+                {"collection": "tasks", "query_by": "description,assigned_user"},
+                {"collection": "conditions", "query_by": "proposed_condition,approved_condition"},
+            ]
+            if settings.TYPESENSE_RECORD_CHUNKS:
+                # Search record content chunks, returning the best-matching chunk for each record.
+                searches[1].update({"collection": "record_chunks", "group_by": "record_id", "group_limit": 1})
+
+            # Results are cached for the requested engine (results of a fallback to Postgres search are not cached).
+            engine = settings.SEARCH_ENGINE
+            cache_key = get_search_cache_key(
+                [search["collection"] for search in searches], {**search_q, "searches": searches, "engine": engine}
+            )
+            search_results = cache.get(cache_key) if settings.SEARCH_CACHE_SECONDS else None
+            context["search_cached"] = search_results is not None
+
+            # Run all searches in a single request, or fail fast to Postgres search while Typesense is unavailable.
+            if search_results is None and engine == "typesense" and typesense_breaker.allow():
+                try:
+                    with typesense_breaker.call():
+                        search_results = client.multi_search.perform({"searches": searches}, search_q)["results"]
+                    # Don't cache incomplete results.
+                    if settings.SEARCH_CACHE_SECONDS and not any("error" in result for result in search_results):
+                        cache.set(cache_key, search_results, settings.SEARCH_CACHE_SECONDS)
+                except Exception:
+                    LOGGER.exception("Typesense search failed, falling back to Postgres search")
+            collections = ["referrals", "records", "notes", "tasks", "conditions"]
+            if search_results is None:
+                search_results = [postgres_search(collection, search_q["q"], 1, 10) for collection in collections]
+                if engine == "postgres" and settings.SEARCH_CACHE_SECONDS:
+                    cache.set(cache_key, search_results, settings.SEARCH_CACHE_SECONDS)
+
+            hits = {}
+            for search, search_result in zip(collections, search_results):
+                if "error" in search_result:
+                    LOGGER.warning(f"Search of {search} failed: {search_result['error']}")
+                    search_result = {"found": 0, "hits": []}
+                elif "grouped_hits" in search_result:
+                    search_result["hits"] = collapse_grouped_hits(search_result)
+                context[f"{search}_count"] = search_result["found"]
+                hits[search] = search_result["hits"]
+
+            # Referral details are read from the search documents: referral documents, or the denormalised
+            # referral fields of child object documents.
+            referral_objects = {}
+            for hit in hits["referrals"]:
+                document = hit["document"]
+                if "type" in document:
+                    referral_objects[int(document["id"])] = self.get_referral_details(
+                        document["id"], document.get("reference"), document["type"], document.get("regions"), document.get("address")
+                    )
+            for search in ["records", "notes", "tasks", "conditions"]:
+                for hit in hits[search]:
+                    document = hit["document"]
+                    if "referral_type" in document and int(document["referral_id"]) not in referral_objects:
+                        referral_objects[int(document["referral_id"])] = self.get_referral_details(
+                            document["referral_id"],
+                            document.get("referral_reference"),
+                            document["referral_type"],
+                            document.get("referral_regions"),
+                            document.get("referral_address"),
+                        )
+            # Postgres search results (and documents indexed without referral fields) require a database query.
+            referral_ids = {int(hit["document"]["id"]) for hit in hits["referrals"]}
+            for search in ["records", "notes", "tasks", "conditions"]:
+                referral_ids.update(int(hit["document"]["referral_id"]) for hit in hits[search] if hit["document"].get("referral_id"))
+            missing = referral_ids - referral_objects.keys()
+            if missing:
+                for ref in Referral.objects.select_related("type").prefetch_related("regions").filter(pk__in=missing):
+                    referral_objects[ref.pk] = self.get_referral_details(
+                        ref.pk, ref.reference, ref.type.name, [region.name for region in ref.regions.all()], ref.address
+                    )
             referrals = {}
 
             # Referrals
-            search_q["query_by"] = "reference,description,address,type,referring_org,lga"
-            search_result = client.collections["referrals"].documents.search(search_q)
-            context["referrals_count"] = search_result["found"]
-            for hit in search_result["hits"]:
+            for hit in hits["referrals"]:
                 # Explanation for the line below: the Typesense API search response
                 # returns a list of document resources, each containing a `highlight` key
                 # that consists of a dict which contains 1+ `<field_name>` keys, each of which
@@ -277,8 +432,8 @@ class IndexSearchCombined(LoginRequiredMixin, TemplateView):
                 # that causes a StopIteration exception (hence the try-except).
                 try:
                     highlight = next(iter(hit["highlight"].values()))
-                    ref = Referral.objects.get(pk=hit["document"]["id"])
-                    referrals[ref.pk] = {
+                    ref = referral_objects[int(hit["document"]["id"])]
+                    referrals[ref["id"]] = {
                         "referral": ref,
                         "highlight": highlight["snippet"],
                         "records": [],
@@ -289,94 +444,24 @@ class IndexSearchCombined(LoginRequiredMixin, TemplateView):
                 except:
                     pass
 
-            # Records
-            search_q["query_by"] = "name,description,file_name,file_content"
-            search_result = client.collections["records"].documents.search(search_q)
-            context["records_count"] = search_result["found"]
-            for hit in search_result["hits"]:
-                try:
-                    highlight = next(iter(hit["highlight"].values()))
-                    ref = Referral.objects.get(pk=hit["document"]["referral_id"])
-                    if ref.pk in referrals:
-                        referrals[ref.pk]["records"].append((hit["document"]["id"], highlight["snippet"]))
-                    else:
-                        referrals[ref.pk] = {
-                            "referral": ref,
-                            "highlight": {},
-                            "records": [(hit["document"]["id"], highlight["snippet"])],
-                            "notes": [],
-                            "tasks": [],
-                            "conditions": [],
-                        }
-                except:
-                    pass
-
-            # Notes
-            search_q["query_by"] = "note"
-            search_result = client.collections["notes"].documents.search(search_q)
-            context["notes_count"] = search_result["found"]
-            for hit in search_result["hits"]:
-                try:
-                    highlight = next(iter(hit["highlight"].values()))
-                    ref = Referral.objects.get(pk=hit["document"]["referral_id"])
-                    if ref.pk in referrals:
-                        referrals[ref.pk]["notes"].append((hit["document"]["id"], highlight["snippet"]))
-                    else:
-                        referrals[ref.pk] = {
-                            "referral": ref,
-                            "highlight": {},
-                            "records": [],
-                            "notes": [(hit["document"]["id"], highlight["snippet"])],
-                            "tasks": [],
-                            "conditions": [],
-                        }
-                except:
-                    pass
-
-            # Tasks
-            search_q["query_by"] = "description,assigned_user"
-            search_result = client.collections["tasks"].documents.search(search_q)
-            context["tasks_count"] = search_result["found"]
-            for hit in search_result["hits"]:
-                try:
-                    highlight = next(iter(hit["highlight"].values()))
-                    ref = Referral.objects.get(pk=hit["document"]["referral_id"])
-                    if ref.pk in referrals:
-                        referrals[ref.pk]["tasks"].append((hit["document"]["id"], highlight["snippet"]))
-                    else:
-                        referrals[ref.pk] = {
-                            "referral": ref,
-                            "highlight": {},
-                            "records": [],
-                            "notes": [],
-                            "tasks": [(hit["document"]["id"], highlight["snippet"])],
-                            "conditions": [],
-                        }
-                except:
-                    pass
-
-            # Conditions
-            search_q["query_by"] = "proposed_condition,approved_condition"
-            search_result = client.collections["conditions"].documents.search(search_q)
-            context["conditions_count"] = search_result["found"]
-            for hit in search_result["hits"]:
-                try:
-                    if "referral_id" in hit["document"]:
-                        ref = Referral.objects.get(pk=hit["document"]["referral_id"])
+            # Records, notes, tasks and conditions
+            for search in ["records", "notes", "tasks", "conditions"]:
+                for hit in hits[search]:
+                    try:
                         highlight = next(iter(hit["highlight"].values()))
-                        if ref.pk in referrals:
-                            referrals[ref.pk]["conditions"].append((hit["document"]["id"], highlight["snippet"]))
-                        else:
-                            referrals[ref.pk] = {
+                        ref = referral_objects[int(hit["document"]["referral_id"])]
+                        if ref["id"] not in referrals:
+                            referrals[ref["id"]] = {
                                 "referral": ref,
                                 "highlight": {},
                                 "records": [],
                                 "notes": [],
                                 "tasks": [],
-                                "conditions": [(hit["document"]["id"], highlight["snippet"])],
+                                "conditions": [],
                             }
-                except:
-                    pass
+                        referrals[ref["id"]][search].append((hit["document"]["id"], highlight["snippet"]))
+                    except:
+                        pass
 
             # Combine the results into the template context (sort referrals by descending ID).
             for result in sorted(referrals.items(), reverse=True):
@@ -384,6 +469,17 @@ class IndexSearchCombined(LoginRequiredMixin, TemplateView):
 
         return context
 
+    def get_referral_details(self, pk, reference, referral_type, regions, address):
+        """Return a dict of referral details to display in a search result."""
+        return {
+            "id": int(pk),
+            "url": reverse("referral_detail", kwargs={"pk": pk}),
+            "reference": reference or "",
+            "type": referral_type,
+            "regions": ", ".join(regions or []),
+            "address": address or "",
+        }
+
 
 class ReferralCreate(PrsObjectCreate):
     """Dedicated create view for new referrals."""
@@ -481,12 +577,27 @@ class ReferralCreate(PrsObjectCreate):
 
 class ReferralDetail(PrsObjectDetail):
     """Detail view for a single referral. Also includes a queryset of related/
-    child objects in context.
+    child objects in context. Only the active child object tab is rendered,
+    other tabs are loaded on demand (see ReferralDetailTab).
     """
 
     model = Referral
     related_model = None
     template_name = "referral/referral_detail.html"
+    # Child object tabs on the referral details page, and the model type of each.
+    child_tabs = {
+        "tasks": Task,
+        "notes": Note,
+        "records": Record,
+        "locations": Location,
+        "conditions": Condition,
+    }
+    # Related fields of each child model type which are rendered in the child object tables.
+    child_related_fields = {
+        "task": ["type", "state", "assigned_user"],
+        "note": ["type", "creator"],
+        "condition": ["category"],
+    }
 
     def dispatch(self, request, *args, **kwargs):
         # related_model is an optional 'child' of referral (e.g. task, note, etc).
@@ -503,8 +614,22 @@ class ReferralDetail(PrsObjectDetail):
                 return ["referral/referral_notes_print.html"]
         return super().get_template_names()
 
+    def get_queryset(self):
+        # Select/prefetch the related objects rendered on the referral details page.
+        return (
+            super()
+            .get_queryset()
+            .select_related("type", "referring_org", "lga")
+            .prefetch_related(
+                "dop_triggers",
+                "tags",
+                Prefetch("related_refs", queryset=Referral.objects.select_related("type")),
+            )
+        )
+
     def get(self, request, *args, **kwargs):
-        ref = self.get_object()
+        self.object = self.get_object()
+        ref = self.object
         # Deleted? Redirect home.
         if ref.is_deleted():
             messages.warning(self.request, f"Referral {ref.pk} not found.")
@@ -513,57 +638,108 @@ class ReferralDetail(PrsObjectDetail):
         # Update the user's referral history.
         request.user.userprofile.update_referral_history(ref)
 
-        return super().get(request, *args, **kwargs)
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    def get_child_objects(self, model):
+        """Return a list of the current child objects of the passed-in model type for this referral,
+        having the related objects which are rendered in the child object table already selected.
+        """
+        qs = getattr(self.object, f"{model._meta.model_name}_set").current()
+        qs = qs.select_related(*self.child_related_fields.get(model._meta.model_name, []))
+        if model is Record:  # Sort records newest > oldest (nulls last).
+            qs = qs.order_by(F("order_date").desc(nulls_last=True))
+        return list(qs)
+
+    def get_child_table(self, model, objects):
+        """Return the HTML table of the passed-in child objects, displayed in the referral's tab for that model type."""
+        if not objects:
+            return f"No {model._meta.verbose_name_plural} found for this referral"
+        headers = copy(model.get_headers())
+        headers.remove("Referral ID")
+        headers.append("Actions")
+        # Construct the <thead> element.
+        thead = "".join([f"<th>{header}</th>" for header in headers])
+        # Construct the <tbody> element.
+        rows = [f"<tr>{obj.as_row_minus_referral()}{obj.as_row_actions()}</tr>" for obj in objects]
+        tbody = "".join(rows)
+        # Construct the <table> element.
+        table_html = f"""<table class="table table-striped table-bordered table-condensed prs-object-table">
+        <thead><tr>{thead}</tr></thead><tbody>{tbody}<tbody></table>"""
+        if model == Location:  # Append a div for the map viewer.
+            table_html += '<div id="ref_locations"></div>'
+        return mark_safe(table_html)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ref = self.get_object()
+        ref = self.object
         context["title"] = f"REFERRAL DETAILS: {ref.pk}"
         context["page_title"] = f"PRS | Referrals | {ref.pk}"
         context["rel_model"] = self.related_model
         # Test if the user has bookmarked this referral.
-        if Bookmark.objects.current().filter(referral=ref, user=self.request.user).exists():
-            context["bookmark"] = Bookmark.objects.filter(referral=ref, user=self.request.user)[0]
-
-        # Generate a table for each child model type: task_list, note_list, etc. and add to the context.
-        for m in [Task, Note, Record, Location, Condition]:
-            obj_tab = f"tab_{m._meta.model_name}"
-            obj_list = f"{m._meta.model_name}_list"
-            if m.objects.current().filter(referral=ref):
-                obj_name = m._meta.object_name.lower()
-                context[f"{obj_name}_count"] = m.objects.current().filter(referral=ref).count()
-                obj_qs = m.objects.current().filter(referral=ref)
-                if m is Record:  # Sort records newest > oldest (nulls last).
-                    obj_qs = obj_qs.order_by(F("order_date").desc(nulls_last=True))
-                headers = copy(m.get_headers())
-                headers.remove("Referral ID")
-                headers.append("Actions")
-                # Construct the <thead> element.
-                thead = "".join([f"<th>{header}</th>" for header in headers])
-                # Construct the <tbody> element.
-                rows = [f"<tr>{obj.as_row_minus_referral()}{obj.as_row_actions()}</tr>" for obj in obj_qs]
-                tbody = "".join(rows)
-                # Construct the <table> element.
-                table_html = f"""<table class="table table-striped table-bordered table-condensed prs-object-table">
-                <thead><tr>{thead}</tr></thead><tbody>{tbody}<tbody></table>"""
-                if m == Location:  # Append a div for the map viewer.
-                    table_html += '<div id="ref_locations"></div>'
-                obj_tab_html = mark_safe(table_html)
-                context[obj_tab] = obj_tab_html
-                context[obj_list] = obj_qs
+        bookmark = Bookmark.objects.current().filter(referral=ref, user=self.request.user).first()
+        if bookmark:
+            context["bookmark"] = bookmark
+
+        # Child objects are fetched for the active tab (and for notes, when printing notes), plus locations for the map display.
+        # Other tabs only require a count of objects, and the table for each is loaded on demand.
+        fetch = {self.related_model, "locations"}
+        if self.request.GET.get("print") == "notes":
+            fetch.add("notes")
+        for tab, m in self.child_tabs.items():
+            obj_name = m._meta.model_name
+            if tab in fetch:
+                objects = self.get_child_objects(m)
+                context[f"{obj_name}_count"] = len(objects)
+                context[f"{obj_name}_list"] = objects or None
+                if tab == self.related_model:
+                    context[f"tab_{obj_name}"] = self.get_child_table(m, objects)
             else:
-                context[f"{m._meta.object_name.lower()}_count"] = 0
-                context[obj_tab] = f"No {m._meta.verbose_name_plural} found for this referral"
-                context[obj_list] = None
+                context[f"{obj_name}_count"] = getattr(ref, f"{obj_name}_set").current().count()
+            context[f"tab_{obj_name}_url"] = reverse("referral_detail_tab", kwargs={"pk": ref.pk, "related_model": tab})
 
         # Add child locations serialised as GeoJSON (if geometry exists).
-        if any([loc.poly for loc in ref.location_set.current()]):
-            context["geojson_locations"] = serialize("geojson", ref.location_set.current(), geometry_field="poly", srid=4283)
+        if context["location_list"] and any([loc.poly for loc in context["location_list"]]):
+            context["geojson_locations"] = serialize("geojson", context["location_list"], geometry_field="poly", srid=4283)
 
         context["has_conditions"] = ref.condition_set.exists()
         return context
 
 
+class ReferralDetailTab(ReferralDetail):
+    """Returns the HTML table for a single child object tab of the referral details page.
+    Each tab is cached separately, until the referral or its child objects of that type are modified.
+    """
+
+    def get_queryset(self):
+        return Referral.objects.all()
+
+    def get(self, request, *args, **kwargs):
+        if self.related_model not in self.child_tabs:
+            raise Http404
+        self.object = self.get_object()
+        ref = self.object
+        if ref.is_deleted():
+            raise Http404
+
+        model = self.child_tabs[self.related_model]
+        children = getattr(ref, f"{model._meta.model_name}_set").current().aggregate(count=Count("pk"), modified=Max("modified"))
+        modified = children["modified"].timestamp() if children["modified"] else 0
+        cache_key = f"prs:referral_tab:{ref.pk}:{self.related_model}:{ref.modified.timestamp()}:{children['count']}:{modified}"
+        # Clients revalidate the tab using the ETag, and receive a 304 response if it is unchanged.
+        etag = quote_etag(cache_key)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            table_html = cache.get(cache_key)
+            if table_html is None:
+                table_html = self.get_child_table(model, self.get_child_objects(model))
+                cache.set(cache_key, str(table_html), settings.REFERRAL_TAB_CACHE_SECONDS)
+            response = HttpResponse(table_html)
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class ReferralCreateChild(PrsObjectCreate):
     """View to create 'child' objects for a referral, e.g. a Task or Note.
     Also allows the creation of relationships between children (e.g relating
@@ -1539,8 +1715,8 @@ class ReferralPointSearch(LoginRequiredMixin, View):
         except:
             return HttpResponseBadRequest("Bad request")
 
-        locations = Location.objects.current().filter(poly__intersects=Point(x, y)).distinct()
-        referrals = Referral.objects.current().filter(pk__in=[loc.referral.pk for loc in locations]).distinct()
+        locations = Location.objects.current().filter(poly__intersects=Point(x, y))
+        referrals = Referral.objects.current().filter(pk__in=locations.values("referral_id")).select_related("type")
         resp = [
             {
                 "id": referral.pk,
@@ -1555,6 +1731,174 @@ class ReferralPointSearch(LoginRequiredMixin, View):
         return JsonResponse(resp, safe=False)
 
 
+class ReferralSuggest(LoginRequiredMixin, View):
+    """Typeahead endpoint returning JSON of referrals having a reference or address matching
+    the (prefix of the) query string, using the Typesense referrals collection.
+    Falls back to a prefix query in Postgres while Typesense is unavailable.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        q = request.GET.get("q", "").strip()
+        try:
+            per_page = min(max(int(request.GET.get("per_page", 8)), 1), 20)
+        except ValueError:
+            return HttpResponseBadRequest("Bad request")
+        if len(q) < 2:
+            return JsonResponse({"found": 0, "results": []})
+
+        search_q = {
+            "q": q,
+            "query_by": "reference,address",
+            "prefix": "true,true",
+            "num_typos": 0,
+            "per_page": per_page,
+            "include_fields": "id,reference,address",
+            "highlight_fields": "none",
+        }
+        cache_key = get_search_cache_key(["referrals"], {**search_q, "suggest": True})
+        results = cache.get(cache_key) if settings.SUGGEST_CACHE_SECONDS else None
+
+        if results is None:
+            if typesense_breaker.allow():
+                try:
+                    with typesense_breaker.call():
+                        search_result = get_typesense_client().collections["referrals"].documents.search(search_q)
+                    results = {
+                        "found": search_result["found"],
+                        "results": [
+                            {
+                                "id": int(hit["document"]["id"]),
+                                "reference": hit["document"].get("reference", ""),
+                                "address": hit["document"].get("address", ""),
+                            }
+                            for hit in search_result["hits"]
+                        ],
+                    }
+                except Exception:
+                    LOGGER.exception("Typesense suggest query failed, falling back to Postgres")
+            if results is None:
+                queryset = Referral.objects.current().filter(Q(reference__istartswith=q) | Q(address__istartswith=q))
+                results = {
+                    "found": queryset.count(),
+                    "results": [
+                        {"id": pk, "reference": reference or "", "address": address or ""}
+                        for pk, reference, address in queryset.values_list("pk", "reference", "address")[:per_page]
+                    ],
+                }
+            elif settings.SUGGEST_CACHE_SECONDS:
+                cache.set(cache_key, results, settings.SUGGEST_CACHE_SECONDS)
+
+        for result in results["results"]:
+            result["url"] = reverse("referral_detail", kwargs={"pk": result["id"]})
+
+        return JsonResponse(results)
+
+
+class ReferralGeoSearch(LoginRequiredMixin, View):
+    """Endpoint returning JSON of referrals within a radius of a point (lat, lng and radius in km) or within a
+    bounding box (bbox=min_lng,min_lat,max_lng,max_lat), nearest first, using the Typesense referrals collection.
+    Results may also be filtered by text (q) and referral facet values. Falls back to a PostGIS query on the
+    referral point field while Typesense is unavailable.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        # Validate user-supplied query params.
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+            per_page = min(max(int(request.GET.get("per_page", 50)), 1), 250)
+            # Chained comparisons also reject NaN and infinite values.
+            if "bbox" in request.GET:
+                min_lng, min_lat, max_lng, max_lat = [float(i) for i in request.GET["bbox"].split(",")]
+                if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+                    raise ValueError("Invalid bounding box")
+                lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+                radius = None
+            else:
+                lat, lng, radius = float(request.GET["lat"]), float(request.GET["lng"]), float(request.GET.get("radius", 5))
+                if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius < float("inf")):
+                    raise ValueError("Invalid point or radius")
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest("Bad request")
+
+        q = request.GET.get("q", "").strip() or "*"
+        filters = {field: values for field in get_facet_fields("referrals") if (values := [v for v in request.GET.getlist(field) if v])}
+        if radius is None:
+            geo_filter = f"point:({max_lat}, {min_lng}, {max_lat}, {max_lng}, {min_lat}, {max_lng}, {min_lat}, {min_lng})"
+        else:
+            geo_filter = f"point:({lat}, {lng}, {radius} km)"
+        search_q = {
+            "q": q,
+            "query_by": "reference,description,address",
+            "filter_by": " && ".join([geo_filter] + ([get_facet_filter_by(filters)] if filters else [])),
+            "sort_by": f"point({lat}, {lng}):asc",
+            "page": page,
+            "per_page": per_page,
+            "include_fields": "id,reference,type,address,point",
+            "highlight_fields": "none",
+        }
+
+        results = None
+        if typesense_breaker.allow():
+            try:
+                with typesense_breaker.call():
+                    search_result = get_typesense_client().collections["referrals"].documents.search(search_q)
+                results = {
+                    "found": search_result["found"],
+                    "results": [
+                        {
+                            "id": int(hit["document"]["id"]),
+                            "reference": hit["document"].get("reference", ""),
+                            "type": hit["document"].get("type", ""),
+                            "address": hit["document"].get("address", ""),
+                            "lat": hit["document"]["point"][0],
+                            "lng": hit["document"]["point"][1],
+                            "distance_m": hit.get("geo_distance_meters", {}).get("point"),
+                        }
+                        for hit in search_result["hits"]
+                    ],
+                }
+            except Exception:
+                LOGGER.exception("Typesense geo search failed, falling back to PostGIS")
+
+        if results is None:
+            origin = Point(lng, lat, srid=4283)
+            queryset = Referral.objects.current().select_related("type")
+            if radius is None:
+                queryset = queryset.filter(point__within=Polygon.from_bbox((min_lng, min_lat, max_lng, max_lat)))
+            else:
+                queryset = queryset.filter(point__distance_lte=(origin, D(km=radius)))
+            if q != "*":
+                queryset = queryset.filter(search_vector=SearchQuery(q, search_type="websearch", config=SEARCH_CONFIG))
+            if filters:
+                queryset = queryset.filter(get_facet_filter_q("referrals", filters))
+            queryset = queryset.annotate(distance=Distance("point", origin)).order_by("distance")
+            offset = (page - 1) * per_page
+            results = {
+                "found": queryset.count(),
+                "results": [
+                    {
+                        "id": ref.pk,
+                        "reference": ref.reference or "",
+                        "type": ref.type.name,
+                        "address": ref.address or "",
+                        "lat": ref.point.y,
+                        "lng": ref.point.x,
+                        "distance_m": round(ref.distance.m),
+                    }
+                    for ref in queryset[offset : offset + per_page]
+                ],
+            }
+
+        for result in results["results"]:
+            result["url"] = reverse("referral_detail", kwargs={"pk": result["id"]})
+        results["page"] = page
+        return JsonResponse(results)
+
+
 class TagList(PrsObjectList):
     """Custom view to return a readonly list of tags (rendered HTML or JSON)."""
 
@@ -1685,31 +2029,27 @@ class ReferralDelete(PrsObjectDelete):
         RelatedReferral.objects.filter(Q(from_referral=ref) | Q(to_referral=ref)).delete()
         # Delete any tags on the referral
         ref.tags.clear()
-        # Delete tasks
-        # Need iterate this queryset to call the object delete() method
+        # Delete tasks, records, notes, conditions, locations and bookmarks.
+        # Need iterate these querysets to call the object delete() method. The search index documents of
+        # child objects are removed in bulk (by referral ID) on deletion of the referral, below.
         tasks = Task.objects.current().filter(referral=ref)
         for i in tasks:
-            i.delete()
-        # Delete records
+            i.delete(unindex=False)
         records = Record.objects.current().filter(referral=ref)
         for i in records:
-            i.delete()
-        # Delete notes
+            i.delete(unindex=False)
         notes = Note.objects.current().filter(referral=ref)
         for i in notes:
-            i.delete()
-        # Delete conditions
+            i.delete(unindex=False)
         conditions = Condition.objects.current().filter(referral=ref)
         for i in conditions:
             # Delete any clearances on each condition
             # We can just call delete on this queryset.
             Clearance.objects.current().filter(condition=i).delete()
-            i.delete()
-        # Delete locations
+            i.delete(unindex=False)
         locations = Location.objects.current().filter(referral=ref)
         for i in locations:
             i.delete()
-        # Delete bookmarks
         bookmarks = Bookmark.objects.current().filter(referral=ref)
         for i in bookmarks:
             i.delete()
@@ -1,4 +1,5 @@
 import json
+from hashlib import sha256
 from urllib.parse import urlparse
 
 from django.conf import settings
@@ -6,7 +7,7 @@ from django.contrib import messages
 from django.contrib.admin import site
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.serializers import serialize
-from django.db.models import F
+from django.db.models import F, QuerySet
 from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
 from django.shortcuts import redirect
 from django.template.defaultfilters import slugify
@@ -16,7 +17,15 @@ from reversion.models import Version
 from taggit.models import Tag
 
 from referral.forms import FORMS_MAP
-from referral.utils import breadcrumbs_li, get_next_pages, get_previous_pages, get_query, is_model_or_string, prs_user
+from referral.utils import (
+    ListCountPaginator,
+    breadcrumbs_li,
+    get_next_pages,
+    get_previous_pages,
+    get_query,
+    is_model_or_string,
+    prs_user,
+)
 
 
 class PrsObjectList(LoginRequiredMixin, ListView):
@@ -25,8 +34,13 @@ class PrsObjectList(LoginRequiredMixin, ListView):
     """
 
     paginate_by = 20
+    paginator_class = ListCountPaginator
     template_name = "referral/prs_object_list.html"
     http_method_names = ["get", "head", "options"]
+    # Seconds to cache the object count of a filtered list (0 to disable).
+    count_cache_seconds = 0
+    # Unfiltered lists estimated (by the query planner) to return more rows than this use the estimate as the count (0 to disable).
+    count_estimate_threshold = 0
 
     def dispatch(self, request, *args, **kwargs):
         # kwargs must include a Model class, or a string.
@@ -49,12 +63,25 @@ class PrsObjectList(LoginRequiredMixin, ListView):
             # Replace single-quotes with double-quotes
             query_str = query_str.replace("'", r'"')
             # If the model is registered with in admin.py, filter it using
-            # registered search_fields.
+            # registered search_fields. Each field is tested in its own subquery (combined
+            # using UNION), so the queryset does not need to be made distinct.
             if site._registry[self.model].search_fields:
                 search_fields = site._registry[self.model].search_fields
-                entry_query = get_query(query_str, search_fields)
+                entry_query = get_query(query_str, search_fields, self.model)
                 qs = qs.filter(entry_query)
-        return qs.distinct()
+        return qs
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        """Pass the count strategy for the list to the paginator."""
+        if isinstance(queryset, QuerySet):
+            query_str = self.request.GET.get("q")
+            if query_str and self.count_cache_seconds:
+                digest = sha256(query_str.encode()).hexdigest()
+                kwargs["cache_key"] = f"prs:list_count:{self.model._meta.label_lower}:{digest}"
+                kwargs["cache_seconds"] = self.count_cache_seconds
+            elif not query_str and self.count_estimate_threshold:
+                kwargs["estimate_threshold"] = self.count_estimate_threshold
+        return super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -72,7 +99,12 @@ class PrsObjectList(LoginRequiredMixin, ListView):
         context["page_title"] = " | ".join([settings.APPLICATION_ACRONYM, title])
         links = [(reverse("site_home"), "Home"), (None, title)]
         context["breadcrumb_trail"] = breadcrumbs_li(links)
-        context["object_count"] = self.get_queryset().count()
+        # Reuse the paginator count, rather than counting the queryset again.
+        if context["paginator"]:
+            context["object_count"] = context["paginator"].count
+            context["object_count_estimated"] = getattr(context["paginator"], "estimated", False)
+        else:
+            context["object_count"] = len(context["object_list"])
         context["previous_pages"] = get_previous_pages(context["page_obj"])
         context["next_pages"] = get_next_pages(context["page_obj"])
         return context
@@ -194,7 +226,7 @@ class PrsObjectDetail(LoginRequiredMixin, DetailView):
         # Does this model type use tags?
         if hasattr(self.model, "tags"):
             context["object_has_tags"] = True
-        obj = self.get_object()
+        obj = self.object
         context["page_title"] = " | ".join(
             [
                 settings.APPLICATION_ACRONYM,